@@ -2,37 +2,104 @@
 # -*- coding: utf-8 -*-
 import logging
 from datetime import date, datetime
+from threading import Lock
 
 import dash
 import dash_bootstrap_components as dbc
+import pandas as pd
 import pkg_resources
 from dash import Input, Output, State, dcc, html
 from dash_bootstrap_templates import ThemeSwitchAIO
 
 from components import (
-    average_ticket_indicator,
-    brands_graph,
-    daily_sales_graph,
+    clear_filtered_orders_cache,
+    dashboard_dimensions,
     date_picker,
-    filter_orders_df,
     get_filters,
-    monthly_sales_graph,
-    monthly_salesperson_graph,
-    top_five_salesperson_graph,
-    top_salesperson_indicator,
-    total_sales_indicator,
+    get_queried_orders_df,
+    render_dashboard_figures,
+    render_figures,
+)
+from constants import (
+    current_day,
+    current_month,
+    current_year,
+    dashboard_backend,
+    default_start_date,
+)
+from dataframe import (
+    build_filter_index,
+    build_sales_cube,
+    build_sales_orders_df,
+    build_star_schema,
+    drop_orders_seen_before,
+    get_consumer_cols,
+    get_template_df_from_partitions,
+    get_vw_kami_bi_df_from_partitions,
 )
-from constants import current_day, current_month, current_year, sale_nops
-from dataframe import get_vw_kami_bi_df_from_csv, build_orders_df
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
 app_version = pkg_resources.get_distribution('my-package-name').version
 app_logger = logging.getLogger('kami-sales-dashboard')
 app_logger.info('Get BI from database')
-products_df = get_vw_kami_bi_df_from_csv('kami_sales_dashboard/data/out/kami_bi.csv')
-orders_df = build_orders_df(products_df)
-sales_orders_df = orders_df.loc[orders_df['nop'].isin(sale_nops)]
+bi_partitions_dir = 'kami_sales_dashboard/data/out/kami_bi'
+sales_data = {}
+sales_data_lock = Lock()
+
+
+def load_sales_data(start_date):
+    products_df = drop_orders_seen_before(
+        get_vw_kami_bi_df_from_partitions(
+            bi_partitions_dir,
+            start_date=start_date,
+            columns=get_consumer_cols(['dashboard']),
+        ),
+        bi_partitions_dir,
+        start_date,
+    )
+    sales_fact_df, sales_dimensions = build_star_schema(
+        build_sales_orders_df(products_df)
+    )
+    sales_cube_df = build_sales_cube(sales_fact_df)
+    clear_filtered_orders_cache()
+    sales_data.update(
+        start_period=pd.Period(start_date, freq='M'),
+        cube=sales_cube_df,
+        index=build_filter_index(sales_cube_df),
+        dimensions=sales_dimensions,
+    )
+
+
+def get_sales_data(start_date):
+    with sales_data_lock:
+        if start_date and (
+            pd.Period(start_date, freq='M') < sales_data['start_period']
+        ):
+            app_logger.info(f'Load BI partitions from {start_date}')
+            load_sales_data(start_date)
+        return (
+            sales_data['cube'],
+            sales_data['index'],
+            sales_data['dimensions'],
+            sales_data['start_period'],
+        )
+
+
+if dashboard_backend == 'duckdb':
+    from duckdb_backend import (
+        query_dimension_dfs,
+        query_sales_cube_df,
+        query_template_df,
+    )
+
+    sales_data['dimensions'] = query_dimension_dfs(
+        bi_partitions_dir, dashboard_dimensions
+    )
+    template_df = query_template_df(bi_partitions_dir)
+else:
+    load_sales_data(default_start_date)
+    template_df = get_template_df_from_partitions(bi_partitions_dir)
 
 # Style ->
 config_graph = {'displayModeBar': True, 'showTips': True}
@@ -115,12 +182,12 @@ sidebar = html.Div(
                 ),
                 date_picker(
                     'geral',
-                    date(min(products_df['ano'].unique()), 1, 1),
+                    date(template_df['ano'].min(), 1, 1),
                     date(current_year, current_month, current_day),
                     'Período',
                 ),
             ]
-            + get_filters(products_df)
+            + get_filters(template_df)
             + [
                 html.Hr(),
                 html.Center(
@@ -455,6 +522,7 @@ app.layout = dbc.Container(
     fluid=True,
     style={'height': '100vh'},
 )
+del template_df
 
 
 @app.callback(
@@ -470,194 +538,12 @@ def toggle_offcanvas(n1, is_open):
 
 @app.callback(
     Output('graph1', 'figure'),
-    Input('select-salesperson', 'value'),
-    Input('select-uf', 'value'),
-    Input('select-branch', 'value'),
-    Input('select-company', 'value'),
-    Input('date-picker-geral', 'start_date'),
-    Input('date-picker-geral', 'end_date'),
-    Input(ThemeSwitchAIO.ids.switch('theme'), 'value'),
-)
-def graph1(salesperson, uf, branch, company, start_date, end_date, toggle):
-    filters = {
-        'salesperson': salesperson,
-        'uf': uf,
-        'branch': branch,
-        'company': company,
-        'start_date': start_date,
-        'end_date': end_date,
-    }
-    df_filtered = filter_orders_df(sales_orders_df, filters)
-    template = template_ligth if toggle else template_dark
-    figure = daily_sales_graph(df_filtered)
-    figure.update_layout(template=template)
-
-    return figure
-
-
-@app.callback(
     Output('graph2', 'figure'),
-    Input('select-salesperson', 'value'),
-    Input('select-uf', 'value'),
-    Input('select-branch', 'value'),
-    Input('select-company', 'value'),
-    Input('date-picker-geral', 'start_date'),
-    Input('date-picker-geral', 'end_date'),
-    Input(ThemeSwitchAIO.ids.switch('theme'), 'value'),
-)
-def graph2(salesperson, uf, branch, company, start_date, end_date, toggle):
-    filters = {
-        'salesperson': salesperson,
-        'uf': uf,
-        'branch': branch,
-        'company': company,
-        'start_date': start_date,
-        'end_date': end_date,
-    }
-    df_filtered = filter_orders_df(sales_orders_df, filters)
-    template = template_ligth if toggle else template_dark
-    figure = monthly_sales_graph(df_filtered)
-    figure.update_layout(template=template)
-
-    return figure
-
-
-@app.callback(
     Output('graph3', 'figure'),
-    Input('select-salesperson', 'value'),
-    Input('select-uf', 'value'),
-    Input('select-branch', 'value'),
-    Input('select-company', 'value'),
-    Input('date-picker-geral', 'start_date'),
-    Input('date-picker-geral', 'end_date'),
-    Input(ThemeSwitchAIO.ids.switch('theme'), 'value'),
-)
-def graph3(salesperson, uf, branch, company, start_date, end_date, toggle):
-    filters = {
-        'salesperson': salesperson,
-        'uf': uf,
-        'branch': branch,
-        'company': company,
-        'start_date': start_date,
-        'end_date': end_date,
-    }
-    df_filtered = filter_orders_df(sales_orders_df, filters)
-    template = template_ligth if toggle else template_dark
-    figure = brands_graph(df_filtered)
-    figure.update_layout(template=template)
-
-    return figure
-
-
-@app.callback(
     Output('graph4', 'figure'),
-    Input('select-salesperson', 'value'),
-    Input('select-uf', 'value'),
-    Input('select-branch', 'value'),
-    Input('select-company', 'value'),
-    Input('date-picker-geral', 'start_date'),
-    Input('date-picker-geral', 'end_date'),
-    Input(ThemeSwitchAIO.ids.switch('theme'), 'value'),
-)
-def graph4(salesperson, uf, branch, company, start_date, end_date, toggle):
-    filters = {
-        'salesperson': salesperson,
-        'uf': uf,
-        'branch': branch,
-        'company': company,
-        'start_date': start_date,
-        'end_date': end_date,
-    }
-    df_filtered = filter_orders_df(sales_orders_df, filters)
-    template = template_ligth if toggle else template_dark
-    figure = monthly_salesperson_graph(df_filtered)
-    figure.update_layout(template=template)
-
-    return figure
-
-
-@app.callback(
     Output('graph5', 'figure'),
-    Input('select-salesperson', 'value'),
-    Input('select-uf', 'value'),
-    Input('select-branch', 'value'),
-    Input('select-company', 'value'),
-    Input('date-picker-geral', 'start_date'),
-    Input('date-picker-geral', 'end_date'),
-    Input(ThemeSwitchAIO.ids.switch('theme'), 'value'),
-)
-def graph5(salesperson, uf, branch, company, start_date, end_date, toggle):
-    filters = {
-        'salesperson': salesperson,
-        'uf': uf,
-        'branch': branch,
-        'company': company,
-        'start_date': start_date,
-        'end_date': end_date,
-    }
-    df_filtered = filter_orders_df(sales_orders_df, filters)
-    template = template_ligth if toggle else template_dark
-    figure = top_five_salesperson_graph(df_filtered)
-    figure.update_layout(template=template)
-
-    return figure
-
-
-@app.callback(
     Output('kpi1', 'figure'),
-    Input('select-salesperson', 'value'),
-    Input('select-uf', 'value'),
-    Input('select-branch', 'value'),
-    Input('select-company', 'value'),
-    Input('date-picker-geral', 'start_date'),
-    Input('date-picker-geral', 'end_date'),
-    Input(ThemeSwitchAIO.ids.switch('theme'), 'value'),
-)
-def kpi1(salesperson, uf, branch, company, start_date, end_date, toggle):
-    filters = {
-        'salesperson': salesperson,
-        'uf': uf,
-        'branch': branch,
-        'company': company,
-        'start_date': start_date,
-        'end_date': end_date,
-    }
-    df_filtered = filter_orders_df(sales_orders_df, filters)
-    template = template_ligth if toggle else template_dark
-    figure = top_salesperson_indicator(df_filtered)
-    figure.update_layout(template=template)
-
-    return figure
-
-
-@app.callback(
     Output('kpi2', 'figure'),
-    Input('select-salesperson', 'value'),
-    Input('select-uf', 'value'),
-    Input('select-branch', 'value'),
-    Input('select-company', 'value'),
-    Input('date-picker-geral', 'start_date'),
-    Input('date-picker-geral', 'end_date'),
-    Input(ThemeSwitchAIO.ids.switch('theme'), 'value'),
-)
-def kpi2(salesperson, uf, branch, company, start_date, end_date, toggle):
-    filters = {
-        'salesperson': salesperson,
-        'uf': uf,
-        'branch': branch,
-        'company': company,
-        'start_date': start_date,
-        'end_date': end_date,
-    }
-    df_filtered = filter_orders_df(sales_orders_df, filters)
-    template = template_ligth if toggle else template_dark
-    figure = average_ticket_indicator(df_filtered)
-    figure.update_layout(template=template)
-
-    return figure
-
-
-@app.callback(
     Output('kpi3', 'figure'),
     Input('select-salesperson', 'value'),
     Input('select-uf', 'value'),
@@ -667,7 +553,7 @@ def kpi2(salesperson, uf, branch, company, start_date, end_date, toggle):
     Input('date-picker-geral', 'end_date'),
     Input(ThemeSwitchAIO.ids.switch('theme'), 'value'),
 )
-def kpi3(salesperson, uf, branch, company, start_date, end_date, toggle):
+def dashboard(salesperson, uf, branch, company, start_date, end_date, toggle):
     filters = {
         'salesperson': salesperson,
         'uf': uf,
@@ -676,12 +562,33 @@ def kpi3(salesperson, uf, branch, company, start_date, end_date, toggle):
         'start_date': start_date,
         'end_date': end_date,
     }
-    df_filtered = filter_orders_df(sales_orders_df, filters)
     template = template_ligth if toggle else template_dark
-    figure = total_sales_indicator(df_filtered)
-    figure.update_layout(template=template)
-
-    return figure
+    if dashboard_backend == 'duckdb':
+        return render_figures(
+            get_queried_orders_df(
+                query_sales_cube_df,
+                bi_partitions_dir,
+                filters,
+                sales_data['dimensions'],
+            ),
+            sales_data['dimensions'],
+            template,
+        )
+    (
+        sales_cube_df,
+        sales_cube_index,
+        sales_dimensions,
+        start_period,
+    ) = get_sales_data(start_date)
+
+    return render_dashboard_figures(
+        sales_cube_df,
+        sales_cube_index,
+        sales_dimensions,
+        filters,
+        template,
+        start_period,
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from constants import float_cols, str_to_int_cols
+from dataframe import add_date_key_cols, convert_number_cols, get_present_cols
+from kernels import get_day_keys, get_month_keys, sum_by_key, sum_by_key_pair
+
+benchmark_rows = 500000
+benchmark_repeat = 3
+
+
+def build_raw_number_df(rows=benchmark_rows, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(1, 100000, rows).astype(str)
+    prices = np.char.replace(
+        np.round(rng.uniform(0, 10000, rows), 2).astype(str), '.', ','
+    )
+    df = pd.DataFrame(
+        {col: np.char.add(codes, ' ') for col in str_to_int_cols}
+    )
+    for col in float_cols:
+        df[col] = prices
+    df['cep'] = np.char.add(codes, '-000')
+    return df.astype(object)
+
+
+def convert_number_cols_with_pandas(df) -> pd.DataFrame:
+    untyped_cols = get_present_cols(df, str_to_int_cols)
+    df[untyped_cols] = (
+        df[untyped_cols]
+        .replace(regex=[r'\D+'], value='')
+        .apply(pd.to_numeric)
+        .fillna(0)
+        .astype(int)
+    )
+    untyped_cols = get_present_cols(df, float_cols)
+    df[untyped_cols] = (
+        df[untyped_cols].replace(',', '.', regex=True).fillna(0).astype(float)
+    )
+    df['cep'] = df['cep'].str.extract(pat=r'(\d+)', expand=False)
+    return df
+
+
+def build_sales_cube_df(rows=benchmark_rows, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            'dt_faturamento': np.sort(
+                pd.Timestamp('2022-01-01')
+                + pd.to_timedelta(rng.integers(0, 1000, rows), unit='D')
+            ),
+            'cod_colaborador': rng.integers(1, 50, rows).astype('int32'),
+            'valor_nota': rng.uniform(0, 10000, rows),
+        }
+    )
+    df['ano'] = df['dt_faturamento'].dt.year
+    df['mes'] = df['dt_faturamento'].dt.month
+    return add_date_key_cols(df)
+
+
+def aggregate_sales_with_groupby(df):
+    df.groupby('dt_faturamento')['valor_nota'].sum()
+    df.groupby(['ano', 'mes'])['valor_nota'].sum()
+    df.groupby(['dt_faturamento', 'cod_colaborador'])['valor_nota'].sum()
+
+
+def aggregate_sales_with_kernels(df):
+    sales = df['valor_nota'].to_numpy()
+    sum_by_key(get_day_keys(df), sales)
+    sum_by_key(get_month_keys(df), sales)
+    sum_by_key_pair(get_day_keys(df), df['cod_colaborador'].to_numpy(), sales)
+
+
+def measure_rows_per_second(func, df, repeat=benchmark_repeat) -> float:
+    timings = []
+    for _ in range(repeat):
+        frame = df.copy()
+        start = perf_counter()
+        func(frame)
+        timings.append(perf_counter() - start)
+    return len(df) / min(timings)
+
+
+def benchmark_number_parsing(rows=benchmark_rows) -> dict:
+    df = build_raw_number_df(rows)
+    return {
+        'pandas': measure_rows_per_second(convert_number_cols_with_pandas, df),
+        'arrow': measure_rows_per_second(convert_number_cols, df),
+    }
+
+
+def benchmark_sales_aggregations(rows=benchmark_rows) -> dict:
+    df = build_sales_cube_df(rows)
+    return {
+        'groupby': measure_rows_per_second(aggregate_sales_with_groupby, df),
+        'kernels': measure_rows_per_second(aggregate_sales_with_kernels, df),
+    }
+
+
+def print_benchmark(name, results):
+    for engine, rows_per_second in results.items():
+        print(f'{name:<20} {engine:<10} {rows_per_second:>14,.0f} rows/s')
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else benchmark_rows
+    print_benchmark('number parsing', benchmark_number_parsing(rows))
+    print_benchmark('sales aggregations', benchmark_sales_aggregations(rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,12 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from datetime import date, datetime
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from threading import Lock
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -10,15 +15,32 @@ from dash.exceptions import PreventUpdate
 from numerize import numerize
 
 from constants import (
+    dashboard_max_workers,
+    default_start_date,
     filter_cols,
-    sale_nops,
-    starting_year,
+    filter_index_cols,
+    filtered_orders_cache_max_bytes,
     trans_cols,
 )
-from dataframe import (
-    get_opt_lists_from_df,
-    get_salesperson_opt_list,
-    get_value_by_id,
+from dataframe import get_opt_lists_from_df, join_dimension_labels
+from kernels import (
+    days_to_dates,
+    get_day_keys,
+    get_first_labels,
+    get_month_keys,
+    get_month_labels,
+    sum_by_key,
+    sum_by_key_pair,
+)
+from kpis import evaluate_kpis
+from ranking import rank_dimension
+
+filtered_orders_cache = OrderedDict()
+filtered_orders_pending = {}
+filtered_orders_lock = Lock()
+dashboard_executor = ThreadPoolExecutor(
+    max_workers=dashboard_max_workers,
+    thread_name_prefix='dashboard-figures',
 )
 
 
@@ -30,7 +52,7 @@ def date_picker(id, min_date, max_date, title):
                 id=f'date-picker-{id}',
                 min_date_allowed=min_date,
                 max_date_allowed=max_date,
-                start_date=date(starting_year, datetime.now().month, 1),
+                start_date=default_start_date,
                 end_date=datetime.now(),
             ),
         ]
@@ -63,7 +85,9 @@ def single_selects_from_df(df, cols):
 
 def brands_graph(orders_df):
     df = (
-        orders_df.groupby(['cod_marca', 'desc_marca'])['valor_nota']
+        orders_df.groupby(['cod_marca', 'desc_marca'], observed=True)[
+            'valor_nota'
+        ]
         .sum()
         .reset_index()
     )
@@ -82,14 +106,12 @@ def brands_graph(orders_df):
 
 
 def monthly_sales_graph(orders_df):
-    orders_df = orders_df.sort_values(
-        by=['ano', 'mes'], ascending=[True, True]
+    months, sales = sum_by_key(
+        get_month_keys(orders_df), orders_df['valor_nota'].to_numpy()
     )
-    orders_df['ano_mes'] = (
-        orders_df['ano'].astype(str) + '/' + orders_df['mes'].astype(str)
+    df = pd.DataFrame(
+        {'ano_mes': get_month_labels(months), 'valor_nota': sales}
     )
-    orders_df = orders_df.loc[orders_df['nop'].isin(sale_nops)]
-    df = orders_df.groupby(['ano_mes'])['valor_nota'].sum().reset_index()
     figure = go.Figure(
         go.Scatter(
             x=df['ano_mes'], y=df['valor_nota'], mode='lines', fill='tonexty'
@@ -99,9 +121,9 @@ def monthly_sales_graph(orders_df):
     if not df['ano_mes'].empty:
         figure.add_shape(
             type='line',
-            x0=min(df['ano_mes']),
+            x0=df['ano_mes'].iloc[0],
             y0=median,
-            x1=max(df['ano_mes']),
+            x1=df['ano_mes'].iloc[-1],
             y1=median,
             line_color='red',
             line_dash='dot',
@@ -120,51 +142,64 @@ def monthly_sales_graph(orders_df):
     return figure
 
 
-def top_salesperson_indicator(orders_df):
+def get_top_indicator_values(top_df, label_col, average_sales):
+    if top_df.empty:
+        return 'Sem vendas no período', None, None
+    return (
+        top_df[label_col].iloc[0],
+        top_df['valor_nota'].iloc[0],
+        average_sales,
+    )
 
-    sellers_list = get_salesperson_opt_list(orders_df)
 
-    df = orders_df.groupby(['cod_colaborador', 'nome_colaborador'])[
-        'valor_nota'
-    ].sum()
-    df.sort_values(ascending=False, inplace=True)
-    df = df.reset_index()
+def top_salesperson_indicator(orders_df, dimensions=None):
+    name, sales, reference = get_top_indicator_values(
+        rank_dimension(orders_df, 'salespeople', 1, dimensions),
+        'nome_colaborador',
+        evaluate_kpis(orders_df, ['average_salesperson_sales'])[
+            'average_salesperson_sales'
+        ],
+    )
     figure = go.Figure()
     figure.add_trace(
         go.Indicator(
             mode='number+delta',
             title={
-                'text': f"<span style='font-size:100%'>{get_value_by_id(sellers_list, df['cod_colaborador'].iloc[0])}</span><br><span style='font-size:70%'>Em vendas em relação a média</span><br>"
+                'text': f"<span style='font-size:100%'>{name}</span><br><span style='font-size:70%'>Em vendas em relação a média</span><br>"
             },
-            value=df['valor_nota'].iloc[0],
+            value=sales,
             number={'prefix': 'R$'},
             delta={
                 'relative': True,
                 'valueformat': '.1%',
-                'reference': df['valor_nota'].mean(),
+                'reference': reference,
             },
         )
     )
     return figure
 
 
-def top_brand_indicator(orders_df):
-    df = orders_df.groupby(['cod_marca', 'desc_marca'])['valor_nota'].sum()
-    df.sort_values(ascending=False, inplace=True)
-    df = df.reset_index()
+def top_brand_indicator(orders_df, dimensions=None):
+    name, sales, reference = get_top_indicator_values(
+        rank_dimension(orders_df, 'brands', 1, dimensions),
+        'desc_marca',
+        evaluate_kpis(orders_df, ['average_brand_sales'])[
+            'average_brand_sales'
+        ],
+    )
     figure = go.Figure()
     figure.add_trace(
         go.Indicator(
             mode='number+delta',
             title={
-                'text': f"<span style='font-size:100%'>{df['desc_marca'].iloc[0]}</span><br><span style='font-size:70%'>Em vendas em relação a média</span><br>"
+                'text': f"<span style='font-size:100%'>{name}</span><br><span style='font-size:70%'>Em vendas em relação a média</span><br>"
             },
-            value=df['valor_nota'].iloc[0],
+            value=sales,
             number={'prefix': 'R$'},
             delta={
                 'relative': True,
                 'valueformat': '.1%',
-                'reference': df['valor_nota'].mean(),
+                'reference': reference,
             },
         )
     )
@@ -172,9 +207,9 @@ def top_brand_indicator(orders_df):
 
 
 def average_ticket_indicator(orders_df):
-    average_ticket = (
-        orders_df['valor_nota'].sum() / orders_df['cod_pedido'].count()
-    )
+    average_ticket = evaluate_kpis(orders_df, ['average_ticket'])[
+        'average_ticket'
+    ]
     figure = go.Figure()
     figure.add_trace(
         go.Indicator(
@@ -189,11 +224,17 @@ def average_ticket_indicator(orders_df):
     return figure
 
 
-def daily_sales_graph(orders_df):
-    orders_df = orders_df.sort_values(by=['dt_faturamento'], ascending=[True])
-    df = (
-        orders_df.groupby(['dt_faturamento'])['valor_nota'].sum().reset_index()
+def get_daily_sales_df(orders_df) -> pd.DataFrame:
+    days, sales = sum_by_key(
+        get_day_keys(orders_df), orders_df['valor_nota'].to_numpy()
     )
+    return pd.DataFrame(
+        {'dt_faturamento': days_to_dates(days), 'valor_nota': sales}
+    )
+
+
+def daily_sales_graph(orders_df):
+    df = get_daily_sales_df(orders_df)
 
     figure = go.Figure(
         go.Scatter(
@@ -252,25 +293,39 @@ def create_input_filters():
     ]
 
 
-def get_filter_mask(df, col, selected_itens):
-    return (
-        df[col].isin(df[col].unique())
-        if not selected_itens or selected_itens == [0]
-        else df[col].isin(selected_itens)
-    )
+def get_filter_mask(positions_by_value, selected_itens, start, end):
+    mask = np.zeros(end - start, dtype=bool)
+    for item in selected_itens:
+        positions = positions_by_value.get(item)
+        if positions is not None:
+            mask[
+                positions[
+                    positions.searchsorted(start) : positions.searchsorted(end)
+                ]
+                - start
+            ] = True
+    return mask
 
 
 def monthly_salesperson_graph(orders_df):
-    df = (
-        orders_df.groupby(
-            ['dt_faturamento', 'cod_colaborador', 'nome_colaborador']
-        )['valor_nota']
-        .sum()
-        .reset_index()
+    salespeople = orders_df['cod_colaborador'].to_numpy()
+    sales = orders_df['valor_nota'].to_numpy()
+    days, day_salespeople, sales = sum_by_key_pair(
+        get_day_keys(orders_df), salespeople, sales
     )
-    df_group = (
-        orders_df.groupby('dt_faturamento')['valor_nota'].sum().reset_index()
+    codes, names = get_first_labels(
+        salespeople, orders_df['nome_colaborador'].to_numpy()
     )
+    names = pd.Series(names, index=codes)
+    df = pd.DataFrame(
+        {
+            'dt_faturamento': days_to_dates(days),
+            'cod_colaborador': day_salespeople,
+            'nome_colaborador': names.reindex(day_salespeople).to_numpy(),
+            'valor_nota': sales,
+        }
+    ).dropna(subset=['nome_colaborador'])
+    df_group = get_daily_sales_df(orders_df)
 
     figure = px.line(
         df, x='dt_faturamento', y='valor_nota', color='nome_colaborador'
@@ -289,16 +344,8 @@ def monthly_salesperson_graph(orders_df):
     return figure
 
 
-def top_five_salesperson_graph(orders_df):
-    df_salesperson = (
-        orders_df.groupby(['cod_colaborador', 'nome_colaborador'])[
-            'valor_nota'
-        ]
-        .sum()
-        .head(5)
-        .reset_index()
-    )
-    df_salesperson = df_salesperson
+def top_five_salesperson_graph(orders_df, dimensions=None):
+    df_salesperson = rank_dimension(orders_df, 'salespeople', 5, dimensions)
     figure = go.Figure(
         go.Bar(
             x=df_salesperson['nome_colaborador'],
@@ -309,33 +356,30 @@ def top_five_salesperson_graph(orders_df):
     return figure
 
 
-def filter_orders_df(orders_df, filters):
+def get_date_range_positions(orders_df, start_date, end_date):
+    dates = orders_df['dt_faturamento']
+    return (
+        dates.searchsorted(pd.to_datetime(start_date), side='left'),
+        dates.searchsorted(pd.to_datetime(end_date), side='right'),
+    )
+
+
+def filter_orders_df(orders_df, filter_index, filters):
     if not filters['start_date'] or not filters['end_date']:
         raise PreventUpdate
-    else:
-        mask = get_filter_mask(
-            orders_df, 'empresa_nota_fiscal', filters['company']
-        )
-        df_filtered = orders_df.loc[mask]
-        mask = get_filter_mask(orders_df, 'ramo_atividade', filters['branch'])
-        df_filtered = df_filtered.loc[mask]
-        mask = get_filter_mask(orders_df, 'uf', filters['uf'])
-        df_filtered = df_filtered.loc[mask]
-        mask = get_filter_mask(
-            orders_df, 'cod_colaborador', filters['salesperson']
-        )
-        df_filtered = df_filtered.loc[mask]
-        df_filtered = df_filtered.dropna(subset=['dt_faturamento'])
-        df_filtered['dt_faturamento'] = pd.to_datetime(
-            df_filtered['dt_faturamento'], dayfirst=True
-        )
-        df_filtered = df_filtered.loc[
-            df_filtered['dt_faturamento'].between(
-                pd.to_datetime(filters['start_date']),
-                pd.to_datetime(filters['end_date']),
+    start, end = get_date_range_positions(
+        orders_df, filters['start_date'], filters['end_date']
+    )
+    mask = None
+    for filter_id, col in filter_index_cols.items():
+        selected_itens = normalize_filter_values(filters[filter_id])
+        if selected_itens:
+            filter_mask = get_filter_mask(
+                filter_index[col], selected_itens, start, end
             )
-        ]
-    return df_filtered
+            mask = filter_mask if mask is None else mask & filter_mask
+    df_filtered = orders_df.iloc[start:end]
+    return df_filtered if mask is None else df_filtered.loc[mask]
 
 
 def total_sales_indicator(orders_df):
@@ -346,8 +390,154 @@ def total_sales_indicator(orders_df):
             title={
                 'text': f"<span style='font-size:100%'>Total de Vendas para o Período</span><br><span style='font-size:70%'>Em R$</span><br>"
             },
-            value=orders_df['valor_nota'].sum(),
+            value=evaluate_kpis(orders_df, ['total_sales'])['total_sales'],
             number={'prefix': 'R$'},
         )
     )
     return figure
+
+
+def normalize_filter_values(selected_itens) -> tuple:
+    if not selected_itens or list(selected_itens) == [0]:
+        return ()
+    return tuple(sorted(set(selected_itens), key=str))
+
+
+def normalize_filters(filters) -> tuple:
+    return (
+        normalize_filter_values(filters['salesperson']),
+        normalize_filter_values(filters['uf']),
+        normalize_filter_values(filters['branch']),
+        normalize_filter_values(filters['company']),
+        pd.to_datetime(filters['start_date']),
+        pd.to_datetime(filters['end_date']),
+    )
+
+
+def evict_filtered_orders_cache():
+    # deep=False on purpose: the filtered frames share their string
+    # objects with the source frame, only the arrays are really new.
+    while len(filtered_orders_cache) > 1 and (
+        sum(size for _, size in filtered_orders_cache.values())
+        > filtered_orders_cache_max_bytes
+    ):
+        filtered_orders_cache.popitem(last=False)
+
+
+def get_cached_orders_df(key, build_orders_df):
+    with filtered_orders_lock:
+        if key in filtered_orders_cache:
+            filtered_orders_cache.move_to_end(key)
+            return filtered_orders_cache[key][0]
+        pending = filtered_orders_pending.get(key)
+        if pending is None:
+            filtered_orders_pending[key] = Future()
+    if pending is not None:
+        return pending.result()
+
+    try:
+        df_filtered = build_orders_df()
+    except BaseException as error:
+        with filtered_orders_lock:
+            filtered_orders_pending.pop(key).set_exception(error)
+        raise
+    with filtered_orders_lock:
+        filtered_orders_cache[key] = (
+            df_filtered,
+            df_filtered.memory_usage(index=True, deep=False).sum(),
+        )
+        evict_filtered_orders_cache()
+        filtered_orders_pending.pop(key).set_result(df_filtered)
+    return df_filtered
+
+
+def clear_filtered_orders_cache():
+    with filtered_orders_lock:
+        filtered_orders_cache.clear()
+
+
+def get_filtered_orders_df(
+    orders_df, filter_index, filters, dimensions, version
+):
+    if not filters['start_date'] or not filters['end_date']:
+        raise PreventUpdate
+    return get_cached_orders_df(
+        (version,) + normalize_filters(filters),
+        lambda: join_dimension_labels(
+            filter_orders_df(orders_df, filter_index, filters),
+            dimensions,
+            dashboard_dimensions,
+        ),
+    )
+
+
+def get_queried_orders_df(query_orders_df, source, filters, dimensions):
+    if not filters['start_date'] or not filters['end_date']:
+        raise PreventUpdate
+    query_filters = dict(
+        filters,
+        **{
+            filter_id: normalize_filter_values(filters[filter_id])
+            for filter_id in filter_index_cols
+        },
+    )
+    return get_cached_orders_df(
+        (source,) + normalize_filters(filters),
+        lambda: join_dimension_labels(
+            query_orders_df(source, query_filters),
+            dimensions,
+            dashboard_dimensions,
+        ),
+    )
+
+
+dashboard_dimensions = ['salespeople', 'brands']
+dashboard_figures = [
+    daily_sales_graph,
+    monthly_sales_graph,
+    brands_graph,
+    monthly_salesperson_graph,
+    top_five_salesperson_graph,
+    top_salesperson_indicator,
+    average_ticket_indicator,
+    total_sales_indicator,
+]
+dashboard_ranking_figures = [
+    top_five_salesperson_graph,
+    top_salesperson_indicator,
+]
+dashboard_kpis = [
+    'total_sales',
+    'average_ticket',
+    'average_salesperson_sales',
+]
+
+
+def render_dashboard_figures(
+    orders_df, filter_index, dimensions, filters, template, version
+) -> list:
+    return render_figures(
+        get_filtered_orders_df(
+            orders_df, filter_index, filters, dimensions, version
+        ),
+        dimensions,
+        template,
+    )
+
+
+def render_figures(df_filtered, dimensions, template) -> list:
+    evaluate_kpis(df_filtered, dashboard_kpis)
+    figures = list(
+        dashboard_executor.map(
+            lambda build_figure: build_figure(df_filtered),
+            [
+                partial(build_figure, dimensions=dimensions)
+                if build_figure in dashboard_ranking_figures
+                else build_figure
+                for build_figure in dashboard_figures
+            ],
+        )
+    )
+    for figure in figures:
+        figure.update_layout(template=template)
+    return figures
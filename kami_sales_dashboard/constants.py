@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from os import getenv
 from dotenv import load_dotenv
 
@@ -60,12 +60,21 @@ industry_areas = ['SITE', 'SALAO', 'PERFUMARIA']
 
 tags = ['_liquido', '_bruto', '_desconto', '_bonificado', '_enxoval']
 starting_year = 2022
+bi_mutable_months = 2
+bi_chunksize = 50000
+bi_max_connections = 4
+filtered_orders_cache_max_bytes = 256 * 1024 * 1024
+dashboard_max_workers = 4
+# 'duckdb' needs the optional extra: poetry install --extras duckdb
+dashboard_backend = getenv('DASHBOARD_BACKEND', 'pandas')
+master_max_workers = 4
 
 scope = 'https://www.googleapis.com/auth/drive'
 key_file_location = 'service_account_credentials.json'
 current_month = datetime.now().month
 current_year = datetime.now().year
 current_day = datetime.now().day
+default_start_date = date(starting_year, current_month, 1)
 end_week = datetime.now() - timedelta(days=datetime.today().weekday())
 start_week = end_week - timedelta(days=7)
 current_weekday = datetime.today().weekday()
@@ -80,7 +89,12 @@ db_conn = {
     'port': getenv('DB_PORT'),
     'local_user': getenv('DB_LOCAL_USER'),
     'local_pass': getenv('DB_LOCAL_USER_PASSWORD'),
+    'database': getenv('DB_NAME', 'db_uc_kami'),
 }
+db_pool_size = 5
+db_max_overflow = 5
+db_pool_recycle = 3600
+sql_batch_size = 50
 columns_names_masters = [
     'cod_cliente',
     'razao_social',
@@ -281,6 +295,41 @@ subsidized_nops = [
     'CAMPANHA',
 ]
 trousseau_nops = ['ENXOVAL']
+nop_classes = {
+    'sale': sale_nops,
+    'subsidized': subsidized_nops,
+    'trousseau': trousseau_nops,
+}
+master_metrics = {
+    'liquido': ('sale', 'valor_nota', 'sum'),
+    'desconto': ('sale', 'desconto_pedido', 'sum'),
+    'bruto': ('sale', 'total_bruto', 'sum'),
+    'bonificado': ('subsidized', 'valor_nota', 'sum'),
+    'enxoval': ('trousseau', 'valor_nota', 'sum'),
+    'vendas': ('sale', 'cod_pedido', 'count'),
+}
+kpi_registry = {
+    'total_sales': ('sum', 'valor_nota'),
+    'total_orders': ('sum', 'qtd_pedidos'),
+    'average_ticket': ('ratio', 'total_sales', 'total_orders'),
+    'sales_by_salesperson': ('sum_by', 'cod_colaborador', 'valor_nota'),
+    'sales_by_brand': ('sum_by', 'cod_marca', 'valor_nota'),
+    'sales_by_customer': ('sum_by', 'cod_cliente', 'valor_nota'),
+    'average_salesperson_sales': ('mean', 'sales_by_salesperson'),
+    'average_brand_sales': ('mean', 'sales_by_brand'),
+}
+ranking_kpis = {
+    'salespeople': 'sales_by_salesperson',
+    'brands': 'sales_by_brand',
+    'customers': 'sales_by_customer',
+}
+master_windows = {
+    'qtd_total_compras': ('vendas', None),
+    'qtd_compras_semestre': ('vendas', 180),
+    'total_compras_semestre': ('liquido', 180),
+    'total_compras_trimestre': ('liquido', 90),
+    'total_compras_bimestre': ('liquido', 60),
+}
 str_to_int_cols = [
     'numero',
     'empresa_nota_fiscal',
@@ -294,6 +343,31 @@ str_to_int_cols = [
     'cod_marca',
 ]
 int_cols = ['dias_atraso', 'qtd']
+int32_cols = [
+    'empresa_nota_fiscal',
+    'cod_colaborador',
+    'cod_pedido',
+    'cod_situacao',
+    'cod_forma_pagto',
+    'cod_grupo_produto',
+    'cod_grupo_pai',
+    'cod_marca',
+    'dias_atraso',
+    'qtd',
+]
+category_cols = [
+    'uf',
+    'cidade',
+    'bairro',
+    'ramo_atividade',
+    'nop',
+    'nome_colaborador',
+    'desc_marca',
+    'desc_situacao',
+    'desc_grupo_produto',
+    'desc_grupo_pai',
+    'forma_pgto',
+]
 float_cols = [
     'valor_devido',
     'custo_total',
@@ -308,12 +382,53 @@ float_cols = [
     'valor_nota',
     'total_bruto',
 ]
+date_cols = [
+    'data_cadastro',
+    'dt_primeira_compra',
+    'dt_ultima_compra',
+    'dt_implante_pedido',
+    'dt_entrega_comprometida',
+    'dt_faturamento',
+]
 trans_cols = {
     'company': 'Empresa',
     'branch': 'Canal de Vendas',
     'uf': 'Estado',
     'salesperson': 'Vendedores',
 }
+filter_index_cols = {
+    'company': 'empresa_nota_fiscal',
+    'branch': 'ramo_atividade',
+    'uf': 'uf',
+    'salesperson': 'cod_colaborador',
+}
+sales_cube_cols = [
+    'dt_faturamento',
+    'ano',
+    'mes',
+    'cod_colaborador',
+    'cod_marca',
+    'uf',
+    'ramo_atividade',
+    'empresa_nota_fiscal',
+]
+dimension_cols = {
+    'customers': [
+        col
+        for col in columns_names_head
+        if col not in ['cod_colaborador', 'nome_colaborador']
+    ],
+    'salespeople': ['cod_colaborador', 'nome_colaborador'],
+    'products': ['cod_produto', 'desc_produto'],
+    'product_groups': [
+        'cod_grupo_produto',
+        'desc_grupo_produto',
+        'cod_grupo_pai',
+        'desc_grupo_pai',
+    ],
+    'brands': ['cod_marca', 'desc_marca'],
+}
+fact_attribute_cols = ['uf', 'ramo_atividade']
 companies = {
     1: 'KAMI CO',
     2: 'NEW HAUSS',
@@ -333,8 +448,6 @@ companies = {
 template_cols = [
     'ano',
     'mes',
-    'cod_cliente',
-    'nome_cliente',
     'ramo_atividade',
     'bairro',
     'cidade',
@@ -351,6 +464,35 @@ template_cols = [
     'desc_marca',
     'empresa_nota_fiscal',
 ]
+dashboard_cols = [
+    'ano',
+    'mes',
+    'cod_pedido',
+    'nop',
+    'dt_faturamento',
+    'valor_nota',
+    'cod_colaborador',
+    'nome_colaborador',
+    'cod_marca',
+    'desc_marca',
+    'uf',
+    'ramo_atividade',
+    'empresa_nota_fiscal',
+]
+master_cols = columns_names_head + [
+    'ano',
+    'mes',
+    'cod_pedido',
+    'nop',
+    'valor_nota',
+    'total_bruto',
+    'desconto_pedido',
+]
+consumer_cols = {
+    'dashboard': dashboard_cols,
+    'master': master_cols,
+    'options': template_cols,
+}
 filter_cols = [
     'Ano',
     'Mês',
@@ -1,35 +1,79 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import asyncio
+import atexit
 import logging
+import sys
+import weakref
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime as dt
 from datetime import timedelta as td
-from os import getenv, system
-from typing import Dict, List
-
+from functools import partial
+from os import listdir, makedirs, remove, replace
+from os.path import exists
+from re import fullmatch
+from tempfile import TemporaryDirectory
+from threading import Lock
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+import asyncmy
+import numpy as np
 import pandas as pd
-from dotenv import load_dotenv
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from kami_logging import benchmark_with, logging_with
 from numpy import dtype
+from pandas.api.types import (
+    infer_dtype,
+    is_datetime64_any_dtype,
+    is_numeric_dtype,
+)
 from sqlalchemy import create_engine
 from sqlalchemy.engine import URL
 
 from constants import (
+    bi_chunksize,
+    bi_max_connections,
+    bi_mutable_months,
+    category_cols,
     columns_names_head,
     companies,
+    consumer_cols,
+    date_cols,
+    db_conn,
+    db_max_overflow,
+    db_pool_recycle,
+    db_pool_size,
+    dimension_cols,
+    fact_attribute_cols,
+    filter_index_cols,
     float_cols,
+    int32_cols,
     int_cols,
+    master_max_workers,
+    master_metrics,
+    master_windows,
     months_ptbr,
     months_ptbr_abbr,
+    nop_classes,
     sale_nops,
+    sales_cube_cols,
+    sql_batch_size,
     starting_year,
     str_to_int_cols,
-    subsidized_nops,
     template_cols,
     trans_cols,
-    trousseau_nops,
 )
 
 db_connector_logger = logging.getLogger('db_connector_logger')
+float_pattern = r'^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$'
+db_engines = {}
+db_engines_lock = Lock()
+orders_df_cache = {}
+orders_df_cache_lock = Lock()
 
 
 @benchmark_with(db_connector_logger)
@@ -39,23 +83,73 @@ def get_vw_kami_bi_df_from_csv(csv_file) -> pd.DataFrame:
     return df
 
 
-@benchmark_with(db_connector_logger)
-@logging_with(db_connector_logger)
-def get_vw_kami_bi_df_from_mysql() -> pd.DataFrame:
-    load_dotenv()
-    connection_url = URL.create(
+def get_bi_period_filter(start_period=None) -> str:
+    if start_period is None:
+        return f'vkb.ano >= {starting_year}'
+    return (
+        f'(vkb.ano > {start_period.year} or '
+        f'(vkb.ano = {start_period.year} and vkb.mes >= {start_period.month}))'
+    )
+
+
+def get_db_url(local=False, credentials=db_conn) -> URL:
+    if local:
+        return URL.create(
+            'mysql+pymysql',
+            username=credentials['local_user'],
+            password=credentials['local_pass'],
+            host='localhost',
+        )
+    return URL.create(
         'mysql+pymysql',
-        username=getenv('DB_USER'),
-        password=getenv('DB_USER_PASSWORD'),
-        host=getenv('DB_HOST'),
-        database='db_uc_kami',
+        username=credentials['user'],
+        password=credentials['pass'],
+        host=credentials['host'],
+        port=int(credentials['port']) if credentials['port'] else None,
+        database=credentials['database'],
     )
-    sqlEngine = create_engine(connection_url, pool_recycle=3600)
-    sqlEngine.connect()
-    vw_kami_bi = pd.read_sql_query(
-        f"select * from vw_kami_bi as vkb where vkb.ano >= {starting_year}", sqlEngine
+
+
+def get_db_engine(local=False, credentials=db_conn):
+    db_url = get_db_url(local, credentials)
+    with db_engines_lock:
+        if db_url not in db_engines:
+            db_engines[db_url] = create_engine(
+                db_url,
+                pool_size=db_pool_size,
+                max_overflow=db_max_overflow,
+                pool_recycle=db_pool_recycle,
+                pool_pre_ping=True,
+            )
+        return db_engines[db_url]
+
+
+@atexit.register
+def dispose_db_engines():
+    with db_engines_lock:
+        for engine in db_engines.values():
+            engine.dispose()
+        db_engines.clear()
+
+
+def get_vw_kami_bi_query(start_period=None) -> str:
+    return (
+        'select * from vw_kami_bi as vkb '
+        f'where {get_bi_period_filter(start_period)}'
     )
-    return pd.DataFrame(vw_kami_bi)
+
+
+def stream_vw_kami_bi_from_mysql(start_period=None, chunksize=bi_chunksize):
+    with get_db_engine().connect().execution_options(
+        stream_results=True
+    ) as connection:
+        for chunk in pd.read_sql_query(
+            get_vw_kami_bi_query(start_period),
+            connection,
+            chunksize=chunksize,
+        ):
+            db_connector_logger.info(f'fetched {len(chunk)} rows')
+            yield build_bi_snapshot_df(chunk)
 
 
 def clean_number_col(df, number_col):
@@ -76,21 +170,117 @@ def clean_strtoint_col(df, number_col) -> pd.Series:
     return clean_col
 
 
+def get_present_cols(df, cols) -> List[str]:
+    return [col for col in cols if col in df.columns]
+
+
+def get_untyped_cols(df, cols) -> List[str]:
+    return [
+        col
+        for col in get_present_cols(df, cols)
+        if not is_numeric_dtype(df[col])
+    ]
+
+
+def get_arrow_strings(col) -> pa.Array:
+    try:
+        return pa.array(col, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array(
+            col.astype('string'), type=pa.string(), from_pandas=True
+        )
+
+
+def report_malformed_values(
+    col_name, strings, malformed, errors='coerce', replacement=0
+):
+    malformed_count = pc.sum(malformed).as_py()
+    if not malformed_count:
+        return
+    samples = pc.unique(pc.filter(strings, malformed))[:5].to_pylist()
+    message = (
+        f'{malformed_count} malformed values in {col_name}, '
+        f'e.g. {samples}'
+    )
+    if errors == 'raise':
+        raise ValueError(message)
+    db_connector_logger.warning(f'{message}; replaced with {replacement}')
+
+
+def parse_int_col(col, errors='coerce') -> pa.Array:
+    strings = get_arrow_strings(col)
+    digits = pc.replace_substring_regex(strings, r'\D+', '')
+    is_blank = pc.equal(digits, '')
+    report_malformed_values(
+        col.name,
+        strings,
+        pc.and_(is_blank, pc.match_substring_regex(strings, r'\S')),
+        errors,
+    )
+    digits = pc.if_else(is_blank, pa.scalar(None, pa.string()), digits)
+    return pc.cast(digits, pa.int64()).fill_null(0)
+
+
+def parse_float_col(col, errors='coerce') -> pa.Array:
+    strings = get_arrow_strings(col)
+    text = pc.utf8_trim_whitespace(pc.replace_substring(strings, ',', '.'))
+    is_number = pc.match_substring_regex(text, float_pattern)
+    report_malformed_values(
+        col.name,
+        strings,
+        pc.and_(pc.invert(is_number), pc.not_equal(text, '')),
+        errors,
+    )
+    text = pc.if_else(is_number, text, pa.scalar(None, pa.string()))
+    return pc.cast(text, pa.float64()).fill_null(0)
+
+
+def parse_cep_col(col) -> pa.Array:
+    strings = get_arrow_strings(col)
+    return pc.struct_field(pc.extract_regex(strings, r'(?P<cep>\d+)'), [0])
+
+
+def parse_date_col(col, errors='coerce') -> pd.Series:
+    if infer_dtype(col, skipna=True) in ['date', 'datetime', 'datetime64']:
+        return pd.to_datetime(col)
+    strings = col.astype('string').str.strip().replace('', pd.NA)
+    is_iso = strings.str.match(r'\d{4}-\d{2}-\d{2}').fillna(False).astype(bool)
+    dates = pd.to_datetime(
+        strings.where(is_iso), format='ISO8601', errors='coerce'
+    ).where(
+        is_iso,
+        pd.to_datetime(
+            strings.where(~is_iso),
+            format='mixed',
+            dayfirst=True,
+            errors='coerce',
+        ),
+    )
+    report_malformed_values(
+        col.name,
+        get_arrow_strings(strings),
+        pa.array(dates.isna() & strings.notna()),
+        errors,
+        replacement='NaT',
+    )
+    return dates
+
+
 @benchmark_with(db_connector_logger)
 @logging_with(db_connector_logger)
-def convert_number_cols(df) -> pd.DataFrame:
-    df[str_to_int_cols] = (
-        df[str_to_int_cols]
-        .replace(regex=[r'\D+'], value='')
-        .apply(pd.to_numeric)
-        .fillna(0)
-        .astype(int)
-    )
-    df[int_cols] = df[int_cols].fillna(0).astype(int)
-    df[float_cols] = (
-        df[float_cols].replace(',', '.', regex=True).fillna(0).astype(float)
-    )
-    df['cep'] = df['cep'].str.extract(pat='(\d+)', expand=False)
+def convert_number_cols(df, errors='coerce') -> pd.DataFrame:
+    for col in get_untyped_cols(df, str_to_int_cols):
+        df[col] = parse_int_col(df[col], errors).to_numpy()
+    typed_cols = get_present_cols(df, str_to_int_cols + int_cols)
+    df[typed_cols] = df[typed_cols].fillna(0).astype(int)
+    typed_cols = get_present_cols(df, int32_cols)
+    df[typed_cols] = df[typed_cols].astype('int32')
+    for col in get_untyped_cols(df, float_cols):
+        df[col] = parse_float_col(df[col], errors).to_numpy()
+    typed_cols = get_present_cols(df, float_cols)
+    df[typed_cols] = df[typed_cols].fillna(0).astype(float)
+    if 'cep' in df.columns:
+        df['cep'] = parse_cep_col(df['cep']).to_numpy(zero_copy_only=False)
     return df
 
 
@@ -103,7 +293,39 @@ def clean_orders_df(orders_df) -> pd.DataFrame:
 @benchmark_with(db_connector_logger)
 @logging_with(db_connector_logger)
 def build_orders_df(df) -> pd.DataFrame:
-    return group_by_orders(convert_number_cols(df), order_cols=['cod_pedido'])
+    order_keys = df['cod_pedido']
+    if not is_numeric_dtype(order_keys):
+        order_keys = pd.Series(parse_int_col(order_keys).to_numpy())
+    return convert_number_cols(
+        df.take(np.flatnonzero(~order_keys.duplicated().to_numpy()))
+    )
+
+
+def evict_orders_df(df_id):
+    with orders_df_cache_lock:
+        orders_df_cache.pop(df_id, None)
+
+
+def get_orders_df(df, version=None) -> pd.DataFrame:
+    # df is left untouched. Without a version the typed, de-duplicated
+    # frame is built on every call. With one, it is memoized per version
+    # and kept, with no size bound, for as long as df is alive, so callers
+    # must pass a new version whenever df changes and treat the result as
+    # read-only.
+    if version is None:
+        return build_orders_df(df)
+    with orders_df_cache_lock:
+        df_ref, cached_version, orders_df = orders_df_cache.get(
+            id(df), (None, None, None)
+        )
+    if df_ref is not None and df_ref() is df and cached_version == version:
+        return orders_df
+    orders_df = build_orders_df(df)
+    with orders_df_cache_lock:
+        if id(df) not in orders_df_cache:
+            weakref.finalize(df, evict_orders_df, id(df))
+        orders_df_cache[id(df)] = (weakref.ref(df), version, orders_df)
+    return orders_df
 
 
 @benchmark_with(db_connector_logger)
@@ -112,183 +334,282 @@ def filter_orders_by_nops(orders_df, nops) -> pd.DataFrame:
     return orders_df.loc[orders_df.nop.isin(nops)]
 
 
-def flat_and_tag_motnh_and_year_cols(df, tag='') -> pd.DataFrame:
-    tag = f'_{tag}' if tag else tag
-    df.columns = df.columns.map(
-        lambda x: f'{months_ptbr_abbr.get(x[1])}_{x[0]}{tag}'
-    )
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def convert_date_cols(df, errors='coerce') -> pd.DataFrame:
+    for col in get_present_cols(df, date_cols):
+        if not is_datetime64_any_dtype(df[col]):
+            df[col] = parse_date_col(df[col], errors)
     return df
 
 
 @benchmark_with(db_connector_logger)
 @logging_with(db_connector_logger)
-def calculate_col_by_costumer(orders_df, col, operation) -> pd.DataFrame:
-    orders_df = build_orders_df(orders_df)
-    return orders_df.pivot_table(
-        index=['cod_cliente', 'nome_cliente'],
-        columns=['ano', 'mes'],
-        values=col,
-        aggfunc=operation,
-        fill_value=0,
-    )
+def convert_category_cols(df) -> pd.DataFrame:
+    for col in get_present_cols(df, category_cols):
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+        elif not df[col].cat.categories.is_monotonic_increasing:
+            df[col] = df[col].cat.reorder_categories(
+                df[col].cat.categories.sort_values()
+            )
+    return df
 
 
-def count_col_by_costumer(orders_df, col) -> pd.DataFrame:
-    return calculate_col_by_costumer(orders_df, col, 'count')
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def build_sales_orders_df(df) -> pd.DataFrame:
+    sales_orders_df = convert_date_cols(
+        filter_orders_by_nops(build_orders_df(df), sale_nops).copy()
+    )
+    sales_orders_df = sales_orders_df.dropna(
+        subset=['dt_faturamento']
+    ).sort_values(by=['dt_faturamento'], kind='stable', ignore_index=True)
+    return add_date_key_cols(sales_orders_df)
 
 
-def sum_col_by_costumer(orders_df, col) -> pd.DataFrame:
-    return calculate_col_by_costumer(orders_df, col, 'sum')
+def add_date_key_cols(df) -> pd.DataFrame:
+    df['dia_ordinal'] = (
+        df['dt_faturamento'].to_numpy(dtype='datetime64[D]').astype('int64')
+    )
+    return df
 
 
-def count_sales_by_costumer(orders_df) -> pd.DataFrame:
-    return flat_and_tag_motnh_and_year_cols(
-        count_col_by_costumer(
-            filter_orders_by_nops(orders_df, sale_nops), col='cod_pedido'
-        ),
-        tag='vendas',
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def build_sales_cube(sales_orders_df) -> pd.DataFrame:
+    sales_cube_df = (
+        sales_orders_df.groupby(
+            sales_cube_cols, dropna=False, sort=True, observed=True
+        )
+        .agg(
+            valor_nota=('valor_nota', 'sum'),
+            qtd_pedidos=('cod_pedido', 'count'),
+        )
+        .reset_index()
     )
+    return add_date_key_cols(sales_cube_df)
 
 
-def count_sales_by_costumer_and_period(
-    orders_df, start_date, end_date, freq
-) -> pd.Series:
-    count_sales_df = count_sales_by_costumer(orders_df)
-    period = pd.period_range(
-        start=start_date,
-        end=end_date,
-        freq=freq,
-    )
-    period_cols = [
-        f'{months_ptbr_abbr[p.month]}_{p.year}_vendas'
-        for p in period
-        if f'{months_ptbr_abbr[p.month]}_{p.year}_vendas'
-        in count_sales_df.columns
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def build_dimension_dfs(df) -> Dict[str, pd.DataFrame]:
+    dimensions = {
+        'companies': pd.DataFrame(
+            {'nome_empresa': pd.Series(companies, dtype='category')}
+        ).rename_axis('empresa_nota_fiscal')
+    }
+    for name, cols in dimension_cols.items():
+        if len(get_present_cols(df, cols)) == len(cols):
+            dimensions[name] = (
+                df[cols]
+                .drop_duplicates(subset=cols[0], keep='last')
+                .set_index(cols[0])
+                .sort_index()
+            )
+    return dimensions
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def build_fact_df(df) -> pd.DataFrame:
+    key_cols = [cols[0] for cols in dimension_cols.values()]
+    label_cols = [
+        col
+        for cols in dimension_cols.values()
+        for col in cols[1:]
+        if col not in key_cols + fact_attribute_cols
     ]
-    return count_sales_df[period_cols].sum(axis=1)
+    return df.drop(columns=get_present_cols(df, label_cols))
 
 
-def sum_net_by_costumer(orders_df) -> pd.DataFrame:
-    return flat_and_tag_motnh_and_year_cols(
-        sum_col_by_costumer(
-            orders_df=filter_orders_by_nops(orders_df, sale_nops),
-            col='valor_nota',
-        ),
-        tag='liquido',
-    )
+def build_star_schema(df) -> Tuple[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    return build_fact_df(df), build_dimension_dfs(df)
 
 
-def sum_gross_by_costumer(orders_df) -> pd.DataFrame:
-    return flat_and_tag_motnh_and_year_cols(
-        sum_col_by_costumer(
-            orders_df=filter_orders_by_nops(orders_df, sale_nops),
-            col='total_bruto',
-        ),
-        tag='bruto',
+def join_dimension_labels(
+    df, dimensions, names: Optional[List[str]] = None
+) -> pd.DataFrame:
+    for name in names or dimensions.keys():
+        dimension_df = dimensions[name]
+        label_cols = [
+            col for col in dimension_df.columns if col not in df.columns
+        ]
+        if label_cols and dimension_df.index.name in df.columns:
+            df = df.join(dimension_df[label_cols], on=dimension_df.index.name)
+    return df
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def build_filter_index(df, cols=filter_index_cols.values()) -> Dict:
+    return {
+        col: df.groupby(col, sort=False, observed=True).indices
+        for col in cols
+    }
+
+
+def get_master_metric_col(col, operation) -> str:
+    return f'{col}_{operation}'
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def aggregate_costumer_months(orders_df) -> pd.DataFrame:
+    nop_class_map = {
+        nop: nop_class
+        for nop_class, nops in nop_classes.items()
+        for nop in nops
+    }
+    metric_aggs = {
+        get_master_metric_col(col, operation): (col, operation)
+        for _, col, operation in master_metrics.values()
+    }
+    return (
+        orders_df.assign(nop_class=orders_df.nop.map(nop_class_map))
+        .groupby(
+            ['cod_cliente', 'nome_cliente', 'ano', 'mes', 'nop_class'],
+            sort=False,
+            observed=True,
+        )
+        .agg(**metric_aggs)
+        .reset_index()
     )
 
 
-def sum_trousseau_by_costumer(orders_df) -> pd.DataFrame:
-    return flat_and_tag_motnh_and_year_cols(
-        sum_col_by_costumer(
-            filter_orders_by_nops(orders_df, trousseau_nops), col='valor_nota'
-        ),
-        tag='enxoval',
+def get_month_key(period) -> int:
+    return period.year * 12 + period.month - 1
+
+
+def get_window_periods(window, today=None) -> Tuple[pd.Period, pd.Period]:
+    today = today or dt.now()
+    current_month = pd.Period(today, freq='M')
+    if window is None:
+        return pd.Period(year=starting_year, month=1, freq='M'), current_month
+    if window == 'ytd':
+        return (
+            pd.Period(year=current_month.year, month=1, freq='M'),
+            current_month,
+        )
+    if isinstance(window, int):
+        return pd.Period(today - td(days=window), freq='M'), current_month - 1
+    return window
+
+
+def build_month_prefix_sums(values) -> np.ndarray:
+    prefix_sums = np.zeros(
+        (values.shape[0], values.shape[1] + 1), dtype=values.dtype
     )
+    np.cumsum(values, axis=1, out=prefix_sums[:, 1:])
+    return prefix_sums
 
 
-def sum_subsidized_by_costumer(orders_df) -> pd.DataFrame:
-    return flat_and_tag_motnh_and_year_cols(
-        sum_col_by_costumer(
-            filter_orders_by_nops(orders_df, subsidized_nops), col='valor_nota'
-        ),
-        tag='bonificado',
+def sum_months_window(prefix_sums, months, start, end) -> np.ndarray:
+    start_pos = np.searchsorted(months, get_month_key(start))
+    end_pos = max(
+        start_pos, np.searchsorted(months, get_month_key(end), side='right')
     )
+    return prefix_sums[:, end_pos] - prefix_sums[:, start_pos]
 
 
-def sum_discount_by_costumer(orders_df) -> pd.DataFrame:
-    return flat_and_tag_motnh_and_year_cols(
-        sum_col_by_costumer(
-            filter_orders_by_nops(orders_df, sale_nops), 'desconto_pedido'
-        ),
-        tag='desconto',
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def build_costumer_month_arrays(costumer_months_df) -> Dict:
+    costumers = pd.MultiIndex.from_frame(
+        costumer_months_df[['cod_cliente', 'nome_cliente']]
+    )
+    costumer_index = costumers.unique().sort_values()
+    costumer_codes = costumer_index.get_indexer(costumers)
+    month_keys = (
+        costumer_months_df.ano.to_numpy() * 12
+        + costumer_months_df.mes.to_numpy()
+        - 1
     )
+    months = np.unique(month_keys)
+    month_codes = np.searchsorted(months, month_keys)
+    nop_class = costumer_months_df.nop_class.to_numpy()
+    metrics = {}
+    for tag, (metric_class, col, operation) in master_metrics.items():
+        rows = nop_class == metric_class
+        if not rows.any():
+            continue
+        values = np.zeros(
+            (len(costumer_index), len(months)),
+            dtype='int64' if operation == 'count' else 'float64',
+        )
+        values[costumer_codes[rows], month_codes[rows]] = costumer_months_df[
+            get_master_metric_col(col, operation)
+        ].to_numpy()[rows]
+        metrics[tag] = (
+            values,
+            np.unique(costumer_codes[rows]),
+            np.unique(month_codes[rows]),
+        )
+    return {'costumers': costumer_index, 'months': months, 'metrics': metrics}
 
 
-def sum_sales_by_costumer_and_period(
-    orders_df, start_date, end_date, freq
-) -> pd.DataFrame:
-    period = pd.period_range(
-        start=start_date,
-        end=end_date,
-        freq=freq,
-    )
-    period_cols = [
-        f'{months_ptbr_abbr[p.month]}_{p.year}_liquido'
-        for p in period
-        if f'{months_ptbr_abbr[p.month]}_{p.year}_liquido' in orders_df.columns
+def build_costumer_month_dfs(costumer_month_arrays) -> Dict[str, pd.DataFrame]:
+    costumer_index = costumer_month_arrays['costumers']
+    month_labels = [
+        f'{months_ptbr_abbr[month % 12 + 1]}_{month // 12}'
+        for month in costumer_month_arrays['months']
     ]
-    return orders_df[period_cols].sum(axis=1)
+    return {
+        tag: pd.DataFrame(
+            values[np.ix_(present_costumers, present_months)],
+            index=costumer_index[present_costumers],
+            columns=[f'{month_labels[m]}_{tag}' for m in present_months],
+        )
+        for tag, (
+            values,
+            present_costumers,
+            present_months,
+        ) in costumer_month_arrays['metrics'].items()
+    }
 
 
 @benchmark_with(db_connector_logger)
 @logging_with(db_connector_logger)
-def build_master_df(df) -> pd.DataFrame:
-    master_df = pd.DataFrame()
+def build_costumer_window_df(
+    costumer_month_arrays, windows=master_windows, today=None
+) -> pd.DataFrame:
+    metrics = costumer_month_arrays['metrics']
+    prefix_sums = {}
+    window_cols = {}
+    for col, (tag, window) in windows.items():
+        if tag not in metrics:
+            continue
+        if tag not in prefix_sums:
+            prefix_sums[tag] = build_month_prefix_sums(metrics[tag][0])
+        window_cols[col] = sum_months_window(
+            prefix_sums[tag],
+            costumer_month_arrays['months'],
+            *get_window_periods(window, today),
+        )
+    return pd.DataFrame(window_cols, index=costumer_month_arrays['costumers'])
+
+
+def build_master_parts(
+    df, version=None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
     head_df = group_by_orders(df, order_cols=['cod_cliente'])[
         columns_names_head
     ]
+    return head_df, aggregate_costumer_months(get_orders_df(df, version))
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def assemble_master_df(head_df, costumer_months_df) -> pd.DataFrame:
+    master_df = pd.DataFrame()
     index_cols = ['cod_cliente']
-    trousseau_df = sum_trousseau_by_costumer(df)
-    subsidized_df = sum_subsidized_by_costumer(df)
-    discount_df = sum_discount_by_costumer(df)
-    net_df = sum_net_by_costumer(df)
-    gross_df = sum_gross_by_costumer(df)
-    amount_sales_df = count_sales_by_costumer(df)
-    end_date = f'{dt.now().year}-{dt.now().month - 1}'
-
-    net_df['qtd_total_compras'] = count_sales_by_costumer_and_period(
-        df,
-        start_date=starting_year,
-        end_date=dt.now().strftime('%Y-%m'),
-        freq='M',
-    )
-    start_date = dt.now() - td(days=180)
-    net_df['qtd_compras_semestre'] = count_sales_by_costumer_and_period(
-        df,
-        start_date=start_date.strftime('%Y-%m'),
-        end_date=end_date,
-        freq='M',
-    )
-    net_df['total_compras_semestre'] = sum_sales_by_costumer_and_period(
-        net_df,
-        start_date=start_date.strftime('%Y-%m'),
-        end_date=end_date,
-        freq='M',
-    )
-    start_date = dt.now() - td(days=90)
-    net_df['total_compras_trimestre'] = sum_sales_by_costumer_and_period(
-        net_df,
-        start_date=start_date.strftime('%Y-%m'),
-        end_date=end_date,
-        freq='M',
-    )
-    start_date = dt.now() - td(days=60)
-    net_df['total_compras_bimestre'] = sum_sales_by_costumer_and_period(
-        net_df,
-        start_date=start_date.strftime('%Y-%m'),
-        end_date=end_date,
-        freq='M',
-    )
-    df_list = [
-        net_df,
-        discount_df,
-        gross_df,
-        subsidized_df,
-        trousseau_df,
-        amount_sales_df,
-    ]
-    dfs = [df for df in df_list if not df.empty]
+    costumer_month_arrays = build_costumer_month_arrays(costumer_months_df)
+    metric_dfs = build_costumer_month_dfs(costumer_month_arrays)
+    if 'liquido' in metric_dfs:
+        metric_dfs['liquido'] = metric_dfs['liquido'].join(
+            build_costumer_window_df(costumer_month_arrays)
+        )
+    dfs = [df for df in metric_dfs.values() if not df.empty]
 
     if len(dfs) > 0:
         master_kpis_df = pd.concat(dfs, ignore_index=False, axis=1)
@@ -299,6 +620,68 @@ def build_master_df(df) -> pd.DataFrame:
     return master_df
 
 
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def build_master_df(df, version=None) -> pd.DataFrame:
+    return assemble_master_df(*build_master_parts(df, version))
+
+
+def build_master_shard(
+    snapshot_file, offset, length
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    with pa.memory_map(snapshot_file) as source:
+        shard_df = (
+            pa.ipc.open_file(source)
+            .read_all()
+            .slice(offset, length)
+            .to_pandas()
+        )
+    return build_master_parts(shard_df)
+
+
+def save_master_snapshot(df, snapshot_file):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(snapshot_file, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def build_master_df_in_shards(
+    df, max_workers=master_max_workers
+) -> pd.DataFrame:
+    if max_workers <= 1:
+        return build_master_df(df)
+    shards = (
+        pd.util.hash_pandas_object(df.cod_cliente, index=False).to_numpy()
+        % max_workers
+    )
+    shard_order = np.argsort(shards, kind='stable')
+    offsets = np.searchsorted(shards[shard_order], range(max_workers + 1))
+    with TemporaryDirectory() as snapshot_dir:
+        snapshot_file = f'{snapshot_dir}/master.arrow'
+        save_master_snapshot(
+            df.iloc[shard_order][
+                get_present_cols(df, get_consumer_cols(['master']))
+            ],
+            snapshot_file,
+        )
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parts = list(
+                executor.map(
+                    partial(build_master_shard, snapshot_file),
+                    offsets[:-1].tolist(),
+                    np.diff(offsets).tolist(),
+                )
+            )
+    head_dfs, costumer_months_dfs = zip(*parts)
+    return assemble_master_df(
+        pd.concat(head_dfs, ignore_index=True),
+        pd.concat(costumer_months_dfs, ignore_index=True),
+    )
+
+
 @benchmark_with(db_connector_logger)
 @logging_with(db_connector_logger)
 def get_template_df(df) -> pd.DataFrame:
@@ -456,25 +839,392 @@ def get_opt_lists_from_df(df, cols) -> Dict:
     return opt_lists
 
 
+def split_sql_statements(sql) -> List[str]:
+    statements = []
+    statement = []
+    delimiter = ';'
+    quote = None
+    index = 0
+    while index < len(sql):
+        char = sql[index]
+        if quote:
+            statement.append(char)
+            if char == '\\' and quote != '`':
+                statement.append(sql[index + 1 : index + 2])
+                index += 1
+            elif char == quote:
+                quote = None
+            index += 1
+        elif char in '\'"`':
+            quote = char
+            statement.append(char)
+            index += 1
+        elif char == '#' or sql.startswith('-- ', index):
+            end = sql.find('\n', index)
+            index = len(sql) if end < 0 else end
+        elif sql.startswith('/*', index) and not sql.startswith('/*!', index):
+            end = sql.find('*/', index + 2)
+            index = len(sql) if end < 0 else end + 2
+        elif (
+            char in 'dD'
+            and sql[index : index + 10].upper() == 'DELIMITER '
+            and not ''.join(statement).strip()
+        ):
+            end = sql.find('\n', index)
+            end = len(sql) if end < 0 else end
+            delimiter = sql[index + 10 : end].strip()
+            index = end
+        elif sql.startswith(delimiter, index):
+            statements.append(''.join(statement).strip())
+            statement = []
+            index += len(delimiter)
+        else:
+            statement.append(char)
+            index += 1
+    statements.append(''.join(statement).strip())
+    return [statement for statement in statements if statement]
+
+
 @benchmark_with(db_connector_logger)
 @logging_with(db_connector_logger)
-def execute_query(sql_file, db_conn):
+def execute_query(
+    sql_file, db_conn=db_conn, batch_size=sql_batch_size
+) -> List:
     db_connector_logger.info(f'execute {sql_file}')
-    system(
-        f"mysql -u {db_conn['local_user']} -p{db_conn['local_pass']} < {sql_file}"
+    with open(sql_file, encoding='utf-8') as file:
+        statements = split_sql_statements(file.read())
+    engine = get_db_engine(local=True, credentials=db_conn)
+    timings = []
+    for batch_start in range(0, len(statements), batch_size):
+        with engine.begin() as connection:
+            connection = connection.execution_options(no_parameters=True)
+            for statement in statements[
+                batch_start : batch_start + batch_size
+            ]:
+                start = perf_counter()
+                result = connection.exec_driver_sql(statement)
+                runtime = perf_counter() - start
+                timings.append(
+                    {
+                        'statement': statement,
+                        'runtime': runtime,
+                        'rowcount': result.rowcount,
+                    }
+                )
+                db_connector_logger.info(
+                    f'{runtime:.3f}s, {result.rowcount} rows: '
+                    f"{' '.join(statement.split())[:60]}"
+                )
+    return timings
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def build_bi_snapshot_df(df) -> pd.DataFrame:
+    return convert_category_cols(convert_date_cols(convert_number_cols(df)))
+
+
+def get_bi_snapshot_type(field_type) -> pa.DataType:
+    if pa.types.is_null(field_type):
+        return pa.string()
+    if pa.types.is_dictionary(field_type):
+        return pa.dictionary(
+            pa.int32(), get_bi_snapshot_type(field_type.value_type)
+        )
+    return field_type
+
+
+def get_bi_snapshot_schema(schema) -> pa.Schema:
+    return pa.schema(
+        [
+            field.with_type(get_bi_snapshot_type(field.type))
+            for field in schema
+        ],
+        metadata=schema.metadata,
+    )
+
+
+def write_bi_chunk(writers, parquet_file, chunk):
+    table = pa.Table.from_pandas(chunk, preserve_index=False)
+    if parquet_file not in writers:
+        writers[parquet_file] = pq.ParquetWriter(
+            f'{parquet_file}.tmp',
+            get_bi_snapshot_schema(table.schema),
+            compression='zstd',
+        )
+    writers[parquet_file].write_table(
+        table.cast(writers[parquet_file].schema)
+    )
+
+
+def close_bi_writers(writers, commit=True):
+    for parquet_file, writer in writers.items():
+        writer.close()
+        if commit:
+            replace(f'{parquet_file}.tmp', parquet_file)
+        else:
+            remove(f'{parquet_file}.tmp')
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def save_bi_snapshot(chunks, parquet_file):
+    writers = {}
+    try:
+        for chunk in chunks:
+            write_bi_chunk(writers, parquet_file, chunk)
+    except BaseException:
+        close_bi_writers(writers, commit=False)
+        raise
+    close_bi_writers(writers)
+    if not writers:
+        db_connector_logger.warning(f'no rows to write on {parquet_file}')
+
+
+def get_bi_partition_file(partitions_dir, ano, mes) -> str:
+    return f'{partitions_dir}/{ano}-{mes:02d}.parquet'
+
+
+def get_bi_partition_keys(partitions_dir) -> List[Tuple]:
+    if not exists(partitions_dir):
+        return []
+    return sorted(
+        (int(name[:4]), int(name[5:7]))
+        for name in listdir(partitions_dir)
+        if fullmatch(r'\d{4}-\d{2}\.parquet', name)
+    )
+
+
+def get_bi_partition_files(
+    partitions_dir, start_date=None, end_date=None
+) -> List[str]:
+    start_period = pd.Period(start_date, freq='M') if start_date else None
+    end_period = pd.Period(end_date, freq='M') if end_date else None
+    return [
+        get_bi_partition_file(partitions_dir, ano, mes)
+        for ano, mes in get_bi_partition_keys(partitions_dir)
+        if (start_period is None or (ano, mes) >= get_period_key(start_period))
+        and (end_period is None or (ano, mes) <= get_period_key(end_period))
+    ]
+
+
+def get_bi_partition_files_before(partitions_dir, start_date) -> List[str]:
+    start_key = get_period_key(pd.Period(start_date, freq='M'))
+    return [
+        get_bi_partition_file(partitions_dir, ano, mes)
+        for ano, mes in get_bi_partition_keys(partitions_dir)
+        if (ano, mes) < start_key
+    ]
+
+
+def get_period_key(period) -> Tuple:
+    return period.year, period.month
+
+
+def get_consumer_cols(consumers) -> List[str]:
+    return list(
+        dict.fromkeys(
+            col for consumer in consumers for col in consumer_cols[consumer]
+        )
+    )
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def get_vw_kami_bi_df_from_partitions(
+    partitions_dir, start_date=None, end_date=None, columns=None
+) -> pd.DataFrame:
+    partition_files = get_bi_partition_files(
+        partitions_dir, start_date, end_date
+    )
+    db_connector_logger.info(f'read {len(partition_files)} partitions')
+    return convert_category_cols(
+        ds.dataset(partition_files, format='parquet')
+        .to_table(columns=columns)
+        .to_pandas()
     )
 
 
 @benchmark_with(db_connector_logger)
 @logging_with(db_connector_logger)
-def get_bi_from_view():
-    df = get_vw_kami_bi_df_from_mysql()
-    df.to_csv('data/out/kami_bi.csv', sep=";")
+def drop_orders_seen_before(df, partitions_dir, start_date) -> pd.DataFrame:
+    # An order belongs to the first partition it appears in, so a load
+    # pruned at start_date drops the orders that earlier partitions hold.
+    earlier_files = get_bi_partition_files_before(partitions_dir, start_date)
+    if not earlier_files:
+        return df
+    earlier_orders = pc.unique(
+        ds.dataset(earlier_files, format='parquet')
+        .to_table(columns=['cod_pedido'])
+        .column('cod_pedido')
+    ).drop_null()
+    return df.loc[~df['cod_pedido'].isin(earlier_orders.to_pandas())]
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def get_template_df_from_partitions(partitions_dir) -> pd.DataFrame:
+    template_dfs = [
+        pq.read_table(partition_file, columns=template_cols)
+        .to_pandas()
+        .drop_duplicates()
+        for partition_file in get_bi_partition_files(partitions_dir)
+    ]
+    if not template_dfs:
+        return pd.DataFrame(columns=template_cols)
+    return pd.concat(template_dfs, ignore_index=True).drop_duplicates(
+        ignore_index=True
+    )
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def save_bi_partitions(chunks, partitions_dir) -> List[Tuple]:
+    writers = {}
+    partition_keys = set()
+    try:
+        for chunk in chunks:
+            for (ano, mes), partition_df in chunk.groupby(
+                ['ano', 'mes'], sort=False
+            ):
+                partition_keys.add((int(ano), int(mes)))
+                write_bi_chunk(
+                    writers,
+                    get_bi_partition_file(partitions_dir, ano, mes),
+                    partition_df,
+                )
+    except BaseException:
+        close_bi_writers(writers, commit=False)
+        raise
+    close_bi_writers(writers)
+    return sorted(partition_keys)
+
+
+def get_bi_watermark(partitions_dir) -> pd.Period:
+    partition_keys = get_bi_partition_keys(partitions_dir)
+    if not partition_keys:
+        return None
+    ano, mes = partition_keys[-1]
+    return pd.Period(year=ano, month=mes, freq='M')
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def get_bi_from_view(full_rebuild=False, partitions_dir='data/out/kami_bi'):
+    makedirs(partitions_dir, exist_ok=True)
+    watermark = None if full_rebuild else get_bi_watermark(partitions_dir)
+    start_period = None
+    if watermark is not None:
+        start_period = watermark - (bi_mutable_months - 1)
+        db_connector_logger.info(f'fetch vw_kami_bi from {start_period}')
+    refreshed_keys = save_bi_partitions(
+        stream_vw_kami_bi_from_mysql(start_period), partitions_dir
+    )
+    for ano, mes in get_bi_partition_keys(partitions_dir):
+        if (ano, mes) not in refreshed_keys and (
+            start_period is None or (ano, mes) >= get_period_key(start_period)
+        ):
+            db_connector_logger.info(f'remove stale partition {ano}-{mes}')
+            remove(get_bi_partition_file(partitions_dir, ano, mes))
+
+
+async def create_bi_pool(maxsize=bi_max_connections):
+    return await asyncmy.create_pool(
+        minsize=1,
+        maxsize=maxsize,
+        host=db_conn['host'],
+        port=int(db_conn['port'] or 3306),
+        user=db_conn['user'],
+        password=db_conn['pass'],
+        db=db_conn['database'],
+    )
+
+
+async def fetch_bi_partition_keys(pool, start_period=None) -> List[Tuple]:
+    async with pool.acquire() as connection:
+        async with connection.cursor() as cursor:
+            await cursor.execute(
+                'select distinct vkb.ano, vkb.mes from vw_kami_bi as vkb '
+                f'where {get_bi_period_filter(start_period)} '
+                'order by vkb.ano, vkb.mes'
+            )
+            partition_keys = await cursor.fetchall()
+    return [(int(ano), int(mes)) for ano, mes in partition_keys]
+
+
+async def fetch_vw_kami_bi_partition(pool, ano, mes) -> pd.DataFrame:
+    async with pool.acquire() as connection:
+        async with connection.cursor() as cursor:
+            await cursor.execute(
+                'select * from vw_kami_bi as vkb '
+                'where vkb.ano = %s and vkb.mes = %s',
+                (ano, mes),
+            )
+            rows = await cursor.fetchall()
+            columns = [column[0] for column in cursor.description]
+    return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+
+def save_bi_partition(df, partitions_dir, ano, mes):
+    save_bi_snapshot(
+        [build_bi_snapshot_df(df)],
+        get_bi_partition_file(partitions_dir, ano, mes),
+    )
+
+
+async def extract_bi_partitions(
+    fetch_partition,
+    partition_keys,
+    partitions_dir,
+    max_workers=bi_max_connections,
+) -> List[Tuple]:
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def extract_partition(ano, mes):
+        async with semaphore:
+            df = await fetch_partition(ano, mes)
+            db_connector_logger.info(f'fetched {len(df)} rows of {ano}-{mes}')
+            await asyncio.to_thread(
+                save_bi_partition, df, partitions_dir, ano, mes
+            )
+            return ano, mes, len(df)
+
+    return await asyncio.gather(
+        *[extract_partition(ano, mes) for ano, mes in partition_keys]
+    )
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def get_bi_partitions_from_view(
+    start_period=None, partitions_dir='data/out/kami_bi'
+) -> List[Tuple]:
+    async def extract():
+        pool = await create_bi_pool()
+        try:
+            partition_keys = await fetch_bi_partition_keys(pool, start_period)
+            return await extract_bi_partitions(
+                partial(fetch_vw_kami_bi_partition, pool),
+                partition_keys,
+                partitions_dir,
+            )
+        finally:
+            pool.close()
+            await pool.wait_closed()
+
+    makedirs(partitions_dir, exist_ok=True)
+    return asyncio.run(extract())
+
 
 @benchmark_with(db_connector_logger)
 @logging_with(db_connector_logger)
 def main():
-    get_bi_from_view()
+    for sql_file in [arg for arg in sys.argv[1:] if arg.endswith('.sql')]:
+        execute_query(sql_file)
+    if '--parallel' in sys.argv:
+        get_bi_partitions_from_view()
+    else:
+        get_bi_from_view(full_rebuild='--full' in sys.argv)
 
 
 if __name__ == '__main__':
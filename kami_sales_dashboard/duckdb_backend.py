@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from typing import Dict, List, Tuple
+
+import duckdb
+import pandas as pd
+from kami_logging import benchmark_with, logging_with
+
+from constants import (
+    companies,
+    dimension_cols,
+    filter_index_cols,
+    sale_nops,
+    sales_cube_cols,
+    template_cols,
+)
+from dataframe import (
+    add_date_key_cols,
+    db_connector_logger,
+    get_bi_partition_files,
+    get_bi_partition_files_before,
+)
+
+duckdb_connection = duckdb.connect()
+
+
+def get_partitions_relation(partition_files) -> Tuple[str, List]:
+    return (
+        'read_parquet(?, filename = true, file_row_number = true)',
+        [partition_files],
+    )
+
+
+def get_in_clause(col, values) -> Tuple[str, List]:
+    return f'{col} in ({", ".join("?" for _ in values)})', list(values)
+
+
+def get_sales_filter_clauses(filters) -> Tuple[List[str], List]:
+    clauses = ['dt_faturamento between ? and ?']
+    params = [
+        pd.to_datetime(filters['start_date']).to_pydatetime(),
+        pd.to_datetime(filters['end_date']).to_pydatetime(),
+    ]
+    for clause, values in [get_in_clause('nop', sale_nops)] + [
+        get_in_clause(col, filters[filter_id])
+        for filter_id, col in filter_index_cols.items()
+        if filters[filter_id]
+    ]:
+        clauses.append(clause)
+        params.extend(values)
+    return clauses, params
+
+
+def get_earlier_orders_join(earlier_files) -> Tuple[str, List]:
+    if not earlier_files:
+        return '', []
+    relation, params = get_partitions_relation(earlier_files)
+    return (
+        f'anti join (select distinct cod_pedido from {relation}) '
+        'using (cod_pedido)',
+        params,
+    )
+
+
+def fetch_df(query, params) -> pd.DataFrame:
+    with duckdb_connection.cursor() as cursor:
+        return cursor.execute(query, params).df()
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def query_sales_cube_df(partitions_dir, filters) -> pd.DataFrame:
+    partition_files = get_bi_partition_files(
+        partitions_dir, start_date=filters['start_date']
+    )
+    if not partition_files:
+        return add_date_key_cols(
+            pd.DataFrame(
+                columns=sales_cube_cols + ['valor_nota', 'qtd_pedidos']
+            ).astype({'dt_faturamento': 'datetime64[ns]'})
+        )
+    relation, params = get_partitions_relation(partition_files)
+    earlier_join, earlier_params = get_earlier_orders_join(
+        get_bi_partition_files_before(partitions_dir, filters['start_date'])
+    )
+    clauses, filter_params = get_sales_filter_clauses(filters)
+    cube_cols = ', '.join(sales_cube_cols)
+    query = f'''
+        with orders as (
+            select {cube_cols}, cod_pedido, nop, valor_nota
+            from {relation}
+            {earlier_join}
+            qualify row_number() over (
+                partition by cod_pedido order by filename, file_row_number
+            ) = 1
+        )
+        select
+            {cube_cols},
+            sum(valor_nota) as valor_nota,
+            count(cod_pedido) as qtd_pedidos
+        from orders
+        where {' and '.join(clauses)}
+        group by {cube_cols}
+        order by {cube_cols}
+    '''
+    return add_date_key_cols(
+        fetch_df(query, params + earlier_params + filter_params)
+    )
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def query_dimension_dfs(partitions_dir, names) -> Dict[str, pd.DataFrame]:
+    relation, params = get_partitions_relation(
+        get_bi_partition_files(partitions_dir)
+    )
+    dimensions = {
+        'companies': pd.DataFrame(
+            {'nome_empresa': pd.Series(companies, dtype='category')}
+        ).rename_axis('empresa_nota_fiscal')
+    }
+    for name in names:
+        key_col, *label_cols = dimension_cols[name]
+        labels = ', '.join(
+            f'last({col} order by filename, file_row_number) as {col}'
+            for col in label_cols
+        )
+        dimensions[name] = fetch_df(
+            f'select {key_col}, {labels} from {relation} '
+            f'where {key_col} is not null '
+            f'group by {key_col} order by {key_col}',
+            params,
+        ).set_index(key_col)
+    return dimensions
+
+
+@benchmark_with(db_connector_logger)
+@logging_with(db_connector_logger)
+def query_template_df(partitions_dir) -> pd.DataFrame:
+    relation, params = get_partitions_relation(
+        get_bi_partition_files(partitions_dir)
+    )
+    return fetch_df(
+        f'select distinct {", ".join(template_cols)} from {relation}', params
+    )
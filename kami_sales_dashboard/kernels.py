@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def get_day_keys(orders_df) -> np.ndarray:
+    return orders_df['dia_ordinal'].to_numpy()
+
+
+def get_month_keys(orders_df) -> np.ndarray:
+    return (
+        orders_df['ano'].to_numpy(dtype='int64') * 12
+        + orders_df['mes'].to_numpy(dtype='int64')
+        - 1
+    )
+
+
+def get_first_labels(keys, labels) -> Tuple[np.ndarray, np.ndarray]:
+    unique_keys, first_positions = np.unique(keys, return_index=True)
+    return unique_keys, labels[first_positions]
+
+
+def get_month_labels(month_keys) -> list:
+    return [f'{key // 12}/{key % 12 + 1}' for key in month_keys]
+
+
+def days_to_dates(day_keys) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(
+        day_keys.astype('datetime64[D]').astype('datetime64[ns]')
+    )
+
+
+def sum_by_sorted_key(keys, weights) -> Tuple[np.ndarray, np.ndarray]:
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], np.add.reduceat(weights, starts)
+
+
+def sum_by_key(keys, weights) -> Tuple[np.ndarray, np.ndarray]:
+    if not len(keys):
+        return keys[:0], np.zeros(0)
+    if (keys[1:] >= keys[:-1]).all():
+        return sum_by_sorted_key(keys, weights)
+    offset = keys.min()
+    codes = keys - offset
+    present = np.flatnonzero(np.bincount(codes))
+    return present + offset, np.bincount(codes, weights=weights)[present]
+
+
+def sum_by_key_pair(
+    keys, other_keys, weights
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    if not len(keys):
+        return keys[:0], other_keys[:0], np.zeros(0)
+    offset, other_offset = keys.min(), other_keys.min()
+    width = other_keys.max() - other_offset + 1
+    pair_keys, sums = sum_by_key(
+        (keys - offset) * width + (other_keys - other_offset), weights
+    )
+    return (
+        pair_keys // width + offset,
+        pair_keys % width + other_offset,
+        sums,
+    )
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import weakref
+from threading import Lock
+from typing import Dict, List
+
+from constants import kpi_registry
+from kernels import sum_by_key
+
+kpi_results = {}
+kpi_results_lock = Lock()
+
+
+def sum_kpi(orders_df, results, col):
+    return orders_df[col].sum()
+
+
+def sum_by_kpi(orders_df, results, key_col, col):
+    return sum_by_key(orders_df[key_col].to_numpy(), orders_df[col].to_numpy())
+
+
+def ratio_kpi(orders_df, results, numerator, denominator):
+    return evaluate_kpi(orders_df, numerator, results) / evaluate_kpi(
+        orders_df, denominator, results
+    )
+
+
+def mean_kpi(orders_df, results, grouped_kpi):
+    _, values = evaluate_kpi(orders_df, grouped_kpi, results)
+    return values.mean()
+
+
+kpi_operations = {
+    'sum': sum_kpi,
+    'sum_by': sum_by_kpi,
+    'ratio': ratio_kpi,
+    'mean': mean_kpi,
+}
+
+
+def evaluate_kpi(orders_df, name, results):
+    if name not in results:
+        operation, *args = kpi_registry[name]
+        results[name] = kpi_operations[operation](orders_df, results, *args)
+    return results[name]
+
+
+def evict_kpi_results(df_id):
+    with kpi_results_lock:
+        kpi_results.pop(df_id, None)
+
+
+def get_kpi_results(orders_df) -> Dict:
+    df_ref, results = kpi_results.get(id(orders_df), (None, None))
+    if df_ref is None or df_ref() is not orders_df:
+        results = {}
+        weakref.finalize(orders_df, evict_kpi_results, id(orders_df))
+        kpi_results[id(orders_df)] = (weakref.ref(orders_df), results)
+    return results
+
+
+def evaluate_kpis(orders_df, names: List[str]) -> Dict:
+    with kpi_results_lock:
+        results = get_kpi_results(orders_df)
+        return {name: evaluate_kpi(orders_df, name, results) for name in names}
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from constants import dimension_cols, ranking_kpis, sale_nops
+from dataframe import filter_orders_by_nops, get_orders_df
+from kernels import get_first_labels
+from kpis import evaluate_kpi, get_kpi_results, kpi_results_lock
+
+
+def get_top_totals(keys, values, k) -> pd.Series:
+    return pd.Series(values, index=keys).nlargest(k)
+
+
+def get_rank_labels(orders_df, dimension, keys, dimensions=None) -> pd.Series:
+    key_col, label_col = dimension_cols[dimension][:2]
+    if dimensions is not None and dimension in dimensions:
+        return dimensions[dimension][label_col].reindex(keys)
+    label_keys, labels = get_first_labels(
+        orders_df[key_col].to_numpy(), orders_df[label_col].to_numpy()
+    )
+    return pd.Series(labels, index=label_keys).reindex(keys)
+
+
+def build_rank_df(orders_df, dimension, k, dimensions, results):
+    key_col, label_col = dimension_cols[dimension][:2]
+    ranks = get_top_totals(
+        *evaluate_kpi(orders_df, ranking_kpis[dimension], results), k
+    )
+    return pd.DataFrame(
+        {
+            key_col: ranks.index,
+            label_col: get_rank_labels(
+                orders_df, dimension, ranks.index, dimensions
+            ).to_numpy(),
+            'valor_nota': ranks.to_numpy(),
+        }
+    )
+
+
+def rank_dimension(orders_df, dimension, k, dimensions=None) -> pd.DataFrame:
+    with kpi_results_lock:
+        results = get_kpi_results(orders_df)
+        rank_key = ('rank', dimension, k)
+        if rank_key not in results:
+            results[rank_key] = build_rank_df(
+                orders_df, dimension, k, dimensions, results
+            )
+        return results[rank_key]
+
+
+def rank_customers(df, k, version=None) -> pd.DataFrame:
+    # The sales cube drops cod_cliente, so customers are ranked over the
+    # order-grain sales of the view or master source instead.
+    return rank_dimension(
+        filter_orders_by_nops(get_orders_df(df, version), sale_nops),
+        'customers',
+        k,
+    )
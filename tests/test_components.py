@@ -0,0 +1,53 @@
+import pandas as pd
+
+from components import (
+    clear_filtered_orders_cache,
+    dashboard_dimensions,
+    get_filtered_orders_df,
+)
+from dataframe import add_date_key_cols, build_filter_index
+
+
+def build_cube_df(valor_nota):
+    return add_date_key_cols(
+        pd.DataFrame(
+            {
+                'dt_faturamento': pd.to_datetime(['2023-12-01', '2023-12-20']),
+                'cod_colaborador': [1, 2],
+                'uf': ['SP', 'RJ'],
+                'ramo_atividade': ['LOJA', 'SITE'],
+                'empresa_nota_fiscal': [1, 1],
+                'valor_nota': valor_nota,
+            }
+        )
+    )
+
+
+def get_sales(cube_df, version):
+    filters = {
+        'salesperson': None,
+        'uf': None,
+        'branch': None,
+        'company': None,
+        'start_date': '2023-12-01',
+        'end_date': '2023-12-31',
+    }
+    return get_filtered_orders_df(
+        cube_df,
+        build_filter_index(cube_df),
+        filters,
+        {name: pd.DataFrame() for name in dashboard_dimensions},
+        version,
+    )['valor_nota'].sum()
+
+
+def test_filtered_orders_are_cached_per_loaded_version():
+    clear_filtered_orders_cache()
+    old_period = pd.Period('2023-06', freq='M')
+    new_period = pd.Period('2022-01', freq='M')
+
+    assert get_sales(build_cube_df([1.0, 2.0]), old_period) == 3.0
+    assert get_sales(build_cube_df([10.0, 20.0]), new_period) == 30.0
+
+    clear_filtered_orders_cache()
+    assert get_sales(build_cube_df([5.0, 5.0]), old_period) == 10.0
@@ -0,0 +1,331 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, event
+
+import dataframe
+from constants import db_conn
+from dataframe import (
+    build_master_df,
+    build_master_df_in_shards,
+    build_month_prefix_sums,
+    convert_date_cols,
+    drop_orders_seen_before,
+    execute_query,
+    extract_bi_partitions,
+    get_bi_partition_files,
+    get_month_key,
+    get_orders_df,
+    get_vw_kami_bi_df_from_partitions,
+    get_window_periods,
+    split_sql_statements,
+    sum_months_window,
+)
+
+
+def build_view_rows(ano, mes):
+    return pd.DataFrame(
+        {
+            'cod_pedido': [f'{ano}{mes:02d}1', f'{ano}{mes:02d}2'],
+            'nop': ['VENDA', 'BONIFICADO'],
+            'valor_nota': ['10,50', '2,25'],
+            'dt_faturamento': [f'{ano}-{mes:02d}-01', f'{ano}-{mes:02d}-15'],
+            'uf': ['SP', 'RJ'],
+            'ano': [ano, ano],
+            'mes': [mes, mes],
+        }
+    )
+
+
+def build_master_rows(nops=('VENDA', 'BONIFICADO', 'ENXOVAL')):
+    orders = [order for order in range(1, 61) for _ in range(2)]
+    return pd.DataFrame(
+        {
+            'cod_colaborador': [f'{order % 3 + 1} ' for order in orders],
+            'nome_colaborador': [f'VEND {order % 3 + 1}' for order in orders],
+            'cod_cliente': [order % 7 + 1 for order in orders],
+            'nome_cliente': [f'CLIENTE {order % 7 + 1}' for order in orders],
+            'razao_social': [f'RAZAO {order % 7 + 1}' for order in orders],
+            'ramo_atividade': ['LOJA' for _ in orders],
+            'data_cadastro': ['01/02/2020' for _ in orders],
+            'bairro': ['CENTRO' for _ in orders],
+            'cidade': ['SAO PAULO' for _ in orders],
+            'uf': ['SP' for _ in orders],
+            'endereco': ['RUA A' for _ in orders],
+            'numero': ['10 A' for _ in orders],
+            'cep': ['01234-000' for _ in orders],
+            'dias_atraso': [0 for _ in orders],
+            'valor_devido': ['0,00' for _ in orders],
+            'dt_primeira_compra': ['01/03/2020' for _ in orders],
+            'dt_ultima_compra': ['01/04/2024' for _ in orders],
+            'ano': [2023 + order % 18 // 12 for order in orders],
+            'mes': [order % 18 % 12 + 1 for order in orders],
+            'cod_pedido': [f'PED {order}' for order in orders],
+            'nop': [nops[order % len(nops)] for order in orders],
+            'valor_nota': [f'{order},50' for order in orders],
+            'total_bruto': [f'{order + 1},00' for order in orders],
+            'desconto_pedido': ['0,50' for _ in orders],
+        }
+    )
+
+
+def test_convert_date_cols_parses_iso_and_day_first_dates():
+    df = pd.DataFrame(
+        {
+            'dt_faturamento': [
+                '2024-05-04',
+                '2024-05-14',
+                '04/05/2024',
+                '14/05/2024 10:30:00',
+            ]
+        }
+    )
+
+    assert convert_date_cols(df)['dt_faturamento'].tolist() == [
+        pd.Timestamp('2024-05-04'),
+        pd.Timestamp('2024-05-14'),
+        pd.Timestamp('2024-05-04'),
+        pd.Timestamp('2024-05-14 10:30:00'),
+    ]
+
+
+def test_convert_date_cols_reports_malformed_dates(caplog):
+    df = pd.DataFrame({'dt_faturamento': ['04/05/2024', 'xx', '', None]})
+
+    dates = convert_date_cols(df)['dt_faturamento']
+
+    assert dates.isna().tolist() == [False, True, True, True]
+    assert '1 malformed values in dt_faturamento' in caplog.text
+
+
+def test_convert_date_cols_raises_on_malformed_dates():
+    df = pd.DataFrame({'dt_faturamento': ['04/05/2024', 'xx']})
+
+    with pytest.raises(ValueError, match='malformed values'):
+        convert_date_cols(df, errors='raise')
+
+
+def test_extract_bi_partitions_writes_one_file_per_month(tmp_path):
+    partition_keys = [(2023, 12), (2024, 1), (2024, 2)]
+    fetched = []
+
+    async def fetch_partition(ano, mes):
+        fetched.append((ano, mes))
+        await asyncio.sleep(0)
+        return build_view_rows(ano, mes)
+
+    extracted = asyncio.run(
+        extract_bi_partitions(
+            fetch_partition, partition_keys, str(tmp_path), max_workers=2
+        )
+    )
+
+    assert sorted(fetched) == partition_keys
+    assert extracted == [(ano, mes, 2) for ano, mes in partition_keys]
+    assert get_bi_partition_files(str(tmp_path)) == [
+        f'{tmp_path}/2023-12.parquet',
+        f'{tmp_path}/2024-01.parquet',
+        f'{tmp_path}/2024-02.parquet',
+    ]
+    df = get_vw_kami_bi_df_from_partitions(str(tmp_path), start_date='2024-01')
+    assert df['cod_pedido'].tolist() == [2024011, 2024012, 2024021, 2024022]
+    assert df['valor_nota'].tolist() == [10.5, 2.25, 10.5, 2.25]
+    assert df['dt_faturamento'].tolist() == [
+        pd.Timestamp('2024-01-01'),
+        pd.Timestamp('2024-01-15'),
+        pd.Timestamp('2024-02-01'),
+        pd.Timestamp('2024-02-15'),
+    ]
+
+
+def test_drop_orders_seen_before_keeps_orders_in_their_first_partition(
+    tmp_path,
+):
+    async def fetch_partition(ano, mes):
+        rows = build_view_rows(ano, mes)
+        if (ano, mes) == (2024, 1):
+            rows.loc[0, 'cod_pedido'] = '2023121'
+        return rows
+
+    asyncio.run(
+        extract_bi_partitions(
+            fetch_partition, [(2023, 12), (2024, 1)], str(tmp_path)
+        )
+    )
+
+    for start_date in ['2023-12', '2024-01']:
+        df = get_orders_df(
+            drop_orders_seen_before(
+                get_vw_kami_bi_df_from_partitions(
+                    str(tmp_path), start_date=start_date
+                ),
+                str(tmp_path),
+                start_date,
+            )
+        )
+        assert df.loc[df['ano'] == 2024, 'cod_pedido'].unique().tolist() == [
+            2024012
+        ]
+
+
+def test_split_sql_statements_keeps_quoted_delimiters():
+    sql = (
+        "insert into t values ('a;b', \"c;d\", 'it\\'s;');\n"
+        'select `col;name` from t;'
+    )
+
+    assert split_sql_statements(sql) == [
+        "insert into t values ('a;b', \"c;d\", 'it\\'s;')",
+        'select `col;name` from t',
+    ]
+
+
+def test_split_sql_statements_drops_comments_but_keeps_hints():
+    sql = (
+        '-- drop the view first;\n'
+        '# and recreate it;\n'
+        '/* a; block */ drop view if exists v;\n'
+        '/*!40101 set names utf8 */;\n'
+        'select 1 -- trailing;\n;'
+    )
+
+    assert split_sql_statements(sql) == [
+        'drop view if exists v',
+        '/*!40101 set names utf8 */',
+        'select 1',
+    ]
+
+
+def test_split_sql_statements_follows_delimiter_blocks():
+    sql = (
+        'drop procedure if exists p;\n'
+        'DELIMITER $$\n'
+        'create procedure p() begin select 1; select 2; end$$\n'
+        'DELIMITER ;\n'
+        'call p();'
+    )
+
+    assert split_sql_statements(sql) == [
+        'drop procedure if exists p',
+        'create procedure p() begin select 1; select 2; end',
+        'call p()',
+    ]
+
+
+def test_execute_query_runs_statements_without_parameters(
+    tmp_path, monkeypatch
+):
+    engine = create_engine('sqlite://')
+    executed = []
+    event.listen(
+        engine,
+        'do_execute_no_params',
+        lambda cursor, statement, context: executed.append(statement),
+    )
+    engines = []
+
+    def get_db_engine(local=False, credentials=db_conn):
+        engines.append((local, credentials))
+        return engine
+
+    monkeypatch.setattr(dataframe, 'get_db_engine', get_db_engine)
+    sql_file = tmp_path / 'views.sql'
+    sql_file.write_text(
+        "select strftime('%d/%m/%Y', '2024-05-04');\n"
+        "select 'abc123' like 'abc%';\n",
+        encoding='utf-8',
+    )
+
+    timings = execute_query(str(sql_file), db_conn)
+
+    assert engines == [(True, db_conn)]
+    assert [timing['statement'] for timing in timings] == executed
+    assert executed == [
+        "select strftime('%d/%m/%Y', '2024-05-04')",
+        "select 'abc123' like 'abc%'",
+    ]
+
+
+def test_build_master_df_leaves_its_input_unchanged():
+    df = build_master_rows()
+    original_df = df.copy()
+
+    master_df = build_master_df(df, version=1)
+
+    pd.testing.assert_frame_equal(df, original_df)
+    assert not df.attrs
+    assert master_df['cod_cliente'].tolist() == list(range(1, 8))
+
+
+def test_get_orders_df_reuses_orders_only_for_the_same_version():
+    df = build_master_rows()
+
+    assert get_orders_df(df)['valor_nota'].iloc[0] == 1.5
+    df.loc[0, 'valor_nota'] = '500'
+    assert get_orders_df(df)['valor_nota'].iloc[0] == 500.0
+
+    orders_df = get_orders_df(df, version=1)
+    assert get_orders_df(df, version=1) is orders_df
+    df.loc[0, 'valor_nota'] = '7'
+    assert get_orders_df(df, version=2)['valor_nota'].iloc[0] == 7.0
+    assert not df.attrs
+
+
+def test_build_master_df_without_sales_keeps_the_other_metrics():
+    master_df = build_master_df(build_master_rows(('BONIFICADO', 'ENXOVAL')))
+
+    assert master_df['cod_cliente'].tolist() == list(range(1, 8))
+    assert not [col for col in master_df.columns if col.endswith('_liquido')]
+    assert [col for col in master_df.columns if col.endswith('_bonificado')]
+    assert [col for col in master_df.columns if col.endswith('_enxoval')]
+    assert 'qtd_total_compras' not in master_df.columns
+
+
+def test_sum_months_window_matches_a_direct_sum():
+    periods = pd.PeriodIndex(
+        ['2023-01', '2023-03', '2023-04', '2023-08', '2024-01'], freq='M'
+    )
+    months = np.array([get_month_key(period) for period in periods])
+    values = np.arange(10, dtype='float64').reshape(2, 5)
+    prefix_sums = build_month_prefix_sums(values)
+
+    for start, end in [
+        ('2023-01', '2024-01'),
+        ('2023-02', '2023-04'),
+        ('2023-04', '2023-04'),
+        ('2023-05', '2023-07'),
+        ('2023-09', '2023-02'),
+        ('2024-02', '2024-06'),
+    ]:
+        start, end = pd.Period(start, freq='M'), pd.Period(end, freq='M')
+        in_window = (months >= get_month_key(start)) & (
+            months <= get_month_key(end)
+        )
+
+        np.testing.assert_array_equal(
+            sum_months_window(prefix_sums, months, start, end),
+            values[:, in_window].sum(axis=1),
+        )
+
+
+def test_get_window_periods():
+    today = pd.Timestamp('2024-03-15').to_pydatetime()
+
+    assert get_window_periods('ytd', today) == (
+        pd.Period('2024-01', freq='M'),
+        pd.Period('2024-03', freq='M'),
+    )
+    assert get_window_periods(180, today) == (
+        pd.Period('2023-09', freq='M'),
+        pd.Period('2024-02', freq='M'),
+    )
+
+
+def test_build_master_df_in_shards_matches_the_serial_build():
+    df = build_master_rows()
+
+    pd.testing.assert_frame_equal(
+        build_master_df_in_shards(df, max_workers=3), build_master_df(df)
+    )
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+from kernels import get_month_keys, get_month_labels, sum_by_key
+
+
+def test_month_keys_follow_the_view_year_and_month():
+    orders_df = pd.DataFrame(
+        {
+            'dt_faturamento': pd.to_datetime(
+                ['2022-12-31', '2023-01-01', '2023-01-20', '2023-10-02']
+            ),
+            'ano': [2023, 2023, 2023, 2023],
+            'mes': [1, 1, 1, 10],
+            'valor_nota': [1.0, 2.0, 3.0, 4.0],
+        }
+    )
+
+    months, sales = sum_by_key(
+        get_month_keys(orders_df), orders_df['valor_nota'].to_numpy()
+    )
+
+    assert get_month_labels(months) == ['2023/1', '2023/10']
+    np.testing.assert_array_equal(sales, [6.0, 4.0])
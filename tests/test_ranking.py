@@ -0,0 +1,60 @@
+import pandas as pd
+
+from ranking import rank_customers, rank_dimension
+
+
+def build_sales_df():
+    return pd.DataFrame(
+        {
+            'cod_colaborador': [3, 1, 2, 3, 1, 4],
+            'nome_colaborador': ['C', 'A', 'B', 'C', 'A', 'D'],
+            'valor_nota': [10.0, 5.0, 40.0, 25.0, 1.0, 7.0],
+        }
+    )
+
+
+def test_rank_dimension_sorts_the_top_totals():
+    top_df = rank_dimension(build_sales_df(), 'salespeople', 3)
+
+    assert top_df.to_dict('list') == {
+        'cod_colaborador': [2, 3, 4],
+        'nome_colaborador': ['B', 'C', 'D'],
+        'valor_nota': [40.0, 35.0, 7.0],
+    }
+
+
+def test_rank_dimension_reads_labels_from_the_dimension_table():
+    dimensions = {
+        'salespeople': pd.DataFrame(
+            {'nome_colaborador': ['ANA', 'BIA', 'CAIO', 'DUDA']},
+            index=pd.Index([1, 2, 3, 4], name='cod_colaborador'),
+        )
+    }
+
+    top_df = rank_dimension(build_sales_df(), 'salespeople', 2, dimensions)
+
+    assert top_df['nome_colaborador'].tolist() == ['BIA', 'CAIO']
+
+
+def test_rank_dimension_of_an_empty_period():
+    assert rank_dimension(build_sales_df().iloc[:0], 'salespeople', 5).empty
+
+
+def test_rank_customers_sums_each_sale_order_once():
+    df = pd.DataFrame(
+        {
+            'cod_pedido': ['1', '1', '2', '3', '4', '5'],
+            'cod_cliente': [7, 7, 8, 7, 9, 8],
+            'nome_cliente': ['G', 'G', 'H', 'G', 'I', 'H'],
+            'nop': ['VENDA', 'VENDA', 'VENDA', 'VENDA', 'VENDA', 'ENXOVAL'],
+            'valor_nota': ['10,00', '10,00', '30,00', '5,50', '2,00', '90,00'],
+        }
+    )
+
+    top_df = rank_customers(df, 2)
+
+    assert top_df.to_dict('list') == {
+        'cod_cliente': [8, 7],
+        'nome_cliente': ['H', 'G'],
+        'valor_nota': [30.0, 15.5],
+    }